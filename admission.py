@@ -0,0 +1,246 @@
+import asyncio
+import math
+import re
+import threading
+import time
+
+# Priorities, lower is served first. Spoken questions can't be checked for safety
+# words until Whisper has run, so they sit between safety questions and routine frames.
+SAFETY = 0
+SPOKEN = 1
+NORMAL = 2
+PRIORITY_NAMES = {SAFETY: "safety", SPOKEN: "spoken", NORMAL: "normal"}
+
+SAFETY_PATTERN = re.compile(
+    r"\b(safe|danger\w*|cross(ing)?|traffic|car|cars|obstacle\w*|stairs?|steps?|hole|curb|watch out|"
+    r"careful|emergency|help|hit|fall\w*|road|street|vehicle\w*)\b", re.IGNORECASE)
+
+
+def is_safety_question(text):
+    """Questions about getting hurt jump the queue."""
+    return bool(text) and SAFETY_PATTERN.search(text) is not None
+
+
+class Rejected(Exception):
+    """Request shed by admission control; answer with ``status`` and a ``Retry-After`` header."""
+
+    def __init__(self, reason, status, retry_after):
+        super().__init__(f"Server busy ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """Spend a token; returns 0 on success or the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Ticket:
+    """An admitted request's slot; ``release()`` (or leaving the ``with`` block) hands it to the next waiter."""
+
+    def __init__(self, controller, client, priority):
+        self.controller = controller
+        self.client = client
+        self.priority = priority
+        self.granted = False
+        self.shed = None       # Rejected, if the waiter was pushed out of the queue
+        self.notify = None     # wakes the waiting thread / coroutine
+        self.started = None
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Bounded, prioritised admission in front of the query pipeline.
+
+    At most ``max_active`` requests run at once and ``max_queue`` wait behind
+    them; waiting longer than ``queue_timeout`` sheds the request. Each client
+    is limited to ``per_client`` requests in the system and a token bucket of
+    ``rate`` requests/s (``burst`` deep), whatever their priority. Waiters are
+    served in priority order (safety, spoken, normal); a safety request
+    arriving at a full queue pushes out the newest lower-priority waiter from
+    the same client, never another client's.
+    Limits of 0 disable that check.
+    """
+
+    def __init__(self, max_active=32, max_queue=64, queue_timeout=5.0, per_client=8, rate=10.0, burst=20,
+                 max_clients=10000):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_client = per_client
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = []          # Tickets, in arrival order
+        self._in_system = {}        # client -> active + waiting
+        self._buckets = {}          # client -> TokenBucket
+        self._service_time = 1.0    # EWMA seconds per request, for Retry-After
+        self.admitted = dict.fromkeys(PRIORITY_NAMES, 0)
+        self.shed = {}
+
+    def _reject(self, reason, status, retry_after):
+        # Caller holds the lock
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        return Rejected(reason, status, max(1, math.ceil(retry_after)))
+
+    def _backlog_wait(self):
+        # Rough time for the current backlog to drain, for Retry-After
+        return self._service_time * (len(self._waiting) + 1) / max(1, self.max_active)
+
+    def _enter(self, client, priority):
+        """Admit now, queue, or raise Rejected. Returns the Ticket; caller waits if not yet granted."""
+        now = time.monotonic()
+        with self._lock:
+            if self.rate > 0:
+                bucket = self._buckets.pop(client, None) or TokenBucket(self.rate, self.burst, now)
+                self._buckets[client] = bucket  # re-insert keeps the dict in LRU order
+                if len(self._buckets) > self.max_clients:
+                    del self._buckets[next(iter(self._buckets))]
+                # Priority is decided from client text, so it only orders the queue, never skips the limits
+                wait = bucket.take(now)
+                if wait:
+                    raise self._reject("rate_limited", 429, wait)
+            if self.per_client and self._in_system.get(client, 0) >= self.per_client:
+                raise self._reject("client_busy", 429, self._service_time)
+
+            ticket = Ticket(self, client, priority)
+            self._in_system[client] = self._in_system.get(client, 0) + 1
+            if self.max_active <= 0 or (self._active < self.max_active and not self._waiting):
+                self._grant(ticket)
+                return ticket
+
+            if self.max_queue and len(self._waiting) >= self.max_queue:
+                victim = None
+                if priority == SAFETY:
+                    # The client's own newest waiter of the lowest priority queued
+                    others = [t for t in reversed(self._waiting) if t.client == client and t.priority != SAFETY]
+                    victim = max(others, key=lambda t: t.priority) if others else None
+                if victim is None:
+                    self._leave(client)
+                    raise self._reject("queue_full", 503, self._backlog_wait())
+                self._waiting.remove(victim)
+                self._leave(victim.client)
+                victim.shed = self._reject("displaced", 503, self._backlog_wait())
+                if victim.notify:
+                    victim.notify()
+            self._waiting.append(ticket)
+            return ticket
+
+    def _grant(self, ticket):
+        # Caller holds the lock
+        self._active += 1
+        ticket.granted = True
+        ticket.started = time.monotonic()
+        self.admitted[ticket.priority] += 1
+
+    def _leave(self, client):
+        # Caller holds the lock
+        left = self._in_system.get(client, 0) - 1
+        if left > 0:
+            self._in_system[client] = left
+        else:
+            self._in_system.pop(client, None)
+
+    def _release(self, ticket):
+        with self._lock:
+            if ticket.granted:
+                self._active -= 1
+                self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - ticket.started)
+            self._leave(ticket.client)
+            while self._waiting and self._active < self.max_active:
+                nxt = min(self._waiting, key=lambda t: t.priority)  # oldest of the best priority
+                self._waiting.remove(nxt)
+                self._grant(nxt)
+                if nxt.notify:
+                    nxt.notify()
+
+    def _timed_out(self, ticket):
+        """Called when a waiter gives up; raises the shed error unless it got a slot just in time."""
+        with self._lock:
+            if ticket.granted:
+                return
+            if ticket.shed is None:
+                self._waiting.remove(ticket)
+                self._leave(ticket.client)
+                ticket.shed = self._reject("queue_timeout", 503, self._backlog_wait())
+        ticket._released = True
+        raise ticket.shed
+
+    def _abandon(self, ticket):
+        """A waiter went away (client disconnected): drop it from the queue or give back its slot."""
+        with self._lock:
+            if not ticket.granted:
+                if ticket.shed is None:
+                    self._waiting.remove(ticket)
+                    self._leave(ticket.client)
+                ticket._released = True
+                return
+        ticket.release()
+
+    def admit(self, client, priority=NORMAL):
+        """Block until admitted; returns a Ticket to release (use as a context manager). Raises Rejected."""
+        ticket = self._enter(client, priority)
+        if ticket.granted:
+            return ticket
+        event = threading.Event()
+        ticket.notify = event.set
+        # The slot may have been granted between _enter and setting notify
+        if not ticket.granted and ticket.shed is None:
+            event.wait(self.queue_timeout)
+        self._timed_out(ticket)
+        return ticket
+
+    async def admit_async(self, client, priority=NORMAL):
+        """``admit`` for coroutines: waits without blocking the event loop."""
+        ticket = self._enter(client, priority)
+        if ticket.granted:
+            return ticket
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+        ticket.notify = lambda: loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+        if not ticket.granted and ticket.shed is None:
+            try:
+                await asyncio.wait_for(woken, self.queue_timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                self._abandon(ticket)
+                raise
+        self._timed_out(ticket)
+        return ticket
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": len(self._waiting),
+                "queued_safety": sum(1 for t in self._waiting if t.priority == SAFETY),
+                "admitted": {PRIORITY_NAMES[p]: n for p, n in self.admitted.items()},
+                "shed": dict(self.shed),
+            }
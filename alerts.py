@@ -0,0 +1,72 @@
+import numpy as np
+
+# How dangerous each obstacle class is to walk into (COCO names)
+HAZARD_WEIGHTS = {
+    'car': 3.0, 'bus': 3.0, 'truck': 3.0, 'train': 3.0, 'motorcycle': 3.0,
+    'bicycle': 2.5, 'person': 1.5, 'dog': 1.5, 'horse': 2.0, 'cow': 2.0,
+    'fire hydrant': 1.5, 'bench': 1.2, 'chair': 1.0, 'potted plant': 1.0,
+    'dining table': 1.0, 'couch': 1.0, 'bed': 1.0, 'toilet': 1.0,
+    'suitcase': 1.0, 'stop sign': 0.8, 'parking meter': 1.2,
+}
+
+MIN_CONFIDENCE = 0.35
+CLOSE_AREA = 0.15     # box covers this share of the frame -> "close"
+NEAR_AREA = 0.04      # ... this share -> "near", anything smaller is ignored
+DANGER_SCORE = 0.45   # weighted score at which a warning becomes "danger"
+
+
+def position_of(cx, width):
+    """Horizontal bucket for a box centre."""
+    if cx < width / 3:
+        return 'left'
+    if cx > 2 * width / 3:
+        return 'right'
+    return 'ahead'
+
+
+def assess(res, width, height, min_conf=MIN_CONFIDENCE):
+    """Turn raw YOLO boxes into terse obstacle warnings without calling the LLM.
+
+    Returns ``{"level": "clear"|"warning"|"danger", "alert": str, "hazards": [...]}``
+    with hazards sorted most urgent first.
+    """
+    boxes = res.boxes
+    if len(boxes.cls) == 0:
+        return {"level": "clear", "alert": "", "hazards": []}
+
+    cls = boxes.cls.cpu().numpy().astype(int)
+    conf = boxes.conf.cpu().numpy()
+    xyxy = boxes.xyxy.cpu().numpy()
+
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1]) / float(width * height)
+    cx = (xyxy[:, 0] + xyxy[:, 2]) / 2
+
+    hazards = []
+    for i in np.flatnonzero((conf >= min_conf) & (area >= NEAR_AREA)):
+        name = res.names[int(cls[i])]
+        weight = HAZARD_WEIGHTS.get(name)
+        if weight is None:
+            continue
+        position = position_of(cx[i], width)
+        # Things straight ahead are the ones you walk into
+        score = weight * float(area[i]) * (1.5 if position == 'ahead' else 1.0)
+        hazards.append({
+            "object": name,
+            "position": position,
+            "distance": 'close' if area[i] >= CLOSE_AREA else 'near',
+            "confidence": round(float(conf[i]), 2),
+            "score": round(score, 3),
+        })
+
+    if not hazards:
+        return {"level": "clear", "alert": "", "hazards": []}
+
+    hazards.sort(key=lambda h: h["score"], reverse=True)
+    top = hazards[0]
+    level = 'danger' if top["score"] >= DANGER_SCORE or (
+        top["distance"] == 'close' and top["position"] == 'ahead') else 'warning'
+    return {
+        "level": level,
+        "alert": f"{top['object']} {top['position']}, {top['distance']}",
+        "hazards": hazards,
+    }
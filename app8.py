@@ -1,11 +1,28 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
 from flask_cors import CORS
 from ultralytics import YOLO
-import openai, base64, os, io
-from datetime import datetime
-import requests
+import openai, base64, hmac, os, io, time, ipaddress, json, re, threading, uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait, FIRST_COMPLETED
 import logging
 from PIL import Image
+import numpy as np
+from geo_cache import GeoCache
+from detector_manager import DetectorManager, Variant, parse_variants, variant_name
+from scene_cache import SceneCache, dhash
+from scene_summary import postprocess
+from reply_cache import ReplyCache
+from tracker import TrackerRegistry
+from vad import Clip, prepare_clip, sniff_filename
+from single_flight import SingleFlight, request_key
+from flight_recorder import FlightRecorder
+from session_context import SessionContexts
+from admission import NORMAL, SAFETY, SPOKEN, AdmissionController, Rejected, is_safety_question
+import alerts
+import metrics
+import prompt_builder
+from vision_payload import plan_payload
+from upstream import UpstreamClients
+from metrics import StageTimer
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
@@ -18,206 +35,1103 @@ app.logger.setLevel(logging.INFO)
 # Load API key
 openai.api_key = os.getenv("OPENAI_API_KEY", "your-openai-key-here")
 
+# Shared keep-alive clients for every upstream call (OpenAI and geolocation)
+upstream = UpstreamClients(
+    api_key=openai.api_key,
+    pool_size=int(os.getenv("UPSTREAM_POOL_SIZE", "32")),
+    connect_timeout=float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "3")),
+    read_timeout=float(os.getenv("OPENAI_READ_TIMEOUT", "30")),
+    retries=int(os.getenv("UPSTREAM_RETRIES", "2")),
+)
+openai_client = upstream.openai
+
 # Ensure static directory exists
 os.makedirs('static', exist_ok=True)
 
-# Load YOLO model
+# Load YOLO model - a PyTorch checkpoint, or a CPU-optimized export made with
+# export_model.py (e.g. yolov8n.onnx, yolov8n_int8_openvino_model/)
+YOLO_MODEL = os.getenv("YOLO_MODEL", "yolov8n.pt")
+YOLO_IMGSZ = int(os.getenv("YOLO_IMGSZ", "640"))
+
+# Detector variants, most accurate first, as model@imgsz (e.g. "yolov8s.pt@640,yolov8n.pt@640,yolov8n.pt@320").
+# By default YOLO_MODEL at YOLO_IMGSZ, and for a .pt checkpoint also 480 and 320 to step down to under
+# load; exports have a fixed input size, so list extra sizes for those explicitly (one export per size).
+DEFAULT_SIZES = sorted({YOLO_IMGSZ, 480, 320}, reverse=True) if YOLO_MODEL.endswith('.pt') else [YOLO_IMGSZ]
+YOLO_VARIANTS = parse_variants(os.getenv("YOLO_VARIANTS") or ",".join(
+    f"{YOLO_MODEL}@{size}" for size in DEFAULT_SIZES if size <= YOLO_IMGSZ))
+# Frames are decoded for the largest input size in use; smaller variants letterbox down from it
+DETECT_SIZE = max(size for _, size in YOLO_VARIANTS)
+models = {}
 try:
-    model = YOLO('yolov8n.pt')
-    app.logger.info("✅ YOLOv8n loaded")
+    for path, _ in YOLO_VARIANTS:
+        if path not in models:
+            started = time.perf_counter()
+            models[path] = YOLO(path, task='detect')
+            app.logger.info(f"✅ {path} loaded in {time.perf_counter() - started:.2f}s")
 except Exception:
     app.logger.exception("❌ Failed to load YOLO model")
     raise
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+# Batch frames from concurrent requests into a single forward pass, on the most accurate
+# variant whose measured latency for the current queue fits the budget
+detector = DetectorManager(
+    [Variant(variant_name(path, size), models[path], size) for path, size in YOLO_VARIANTS],
+    budget=float(os.getenv("YOLO_LATENCY_BUDGET_MS", "250")) / 1000,
+    step_up=float(os.getenv("YOLO_STEP_UP", "0.8")),
+    max_failures=int(os.getenv("YOLO_MAX_FAILURES", "3")),
+    cooldown=float(os.getenv("YOLO_FAILURE_COOLDOWN", "60")),
+    max_batch_size=int(os.getenv("YOLO_MAX_BATCH", "8")),
+    max_wait=float(os.getenv("YOLO_MAX_WAIT_MS", "2")) / 1000,
+    verbose=False,
+)
 
-@app.route('/query', methods=['POST'])
-def query():
+# Warm the detector up before reporting ready, so the first real request
+# doesn't pay for lazy initialization (graph compile, allocator, thread pools).
+# Every variant is warmed, which also gives each one a measured latency to start from.
+WARMUP_RUNS = int(os.getenv("YOLO_WARMUP_RUNS", "3"))
+ready = threading.Event()
+startup = {"warmup_runs": WARMUP_RUNS, "warmup_seconds": None, "first_inference_ms": None}
+
+def warm_up():
     try:
-        data = request.get_json(force=True)
-        audio_data = data.get('audio', '')  # Get audio data if present
-        speech = data.get('text', '')
-        img_b64 = data.get('image', '')
-        
-        if not img_b64:
-            return jsonify(error="Missing image data"), 400
-            
-        # Process speech input through Whisper if audio data is provided
-        if audio_data and not speech:
-            try:
-                app.logger.info("Transcribing audio with Whisper")
-                audio_bytes = base64.b64decode(audio_data.split(',', 1)[1])
-                
-                # Save audio temporarily
-                temp_audio_path = os.path.join('static', f"audio_{datetime.now().strftime('%H%M%S')}.webm")
-                with open(temp_audio_path, 'wb') as f:
-                    f.write(audio_bytes)
-                
-                # Transcribe with Whisper
-                with open(temp_audio_path, "rb") as audio_file:
-                    transcription = openai.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file
-                    )
-                speech = transcription.text
-                app.logger.info(f"Whisper transcription: {speech}")
-                
-                # Clean up temp audio file
-                try:
-                    os.remove(temp_audio_path)
-                except Exception as e:
-                    app.logger.warning(f"Failed to delete temp audio: {e}")
-                    
-            except Exception as e:
-                app.logger.error(f"Whisper transcription error: {e}")
-                speech = ""  # Set empty if transcription fails
-        
-        # If we still don't have speech, set a default
-        if not speech.strip():
-            speech = "Describe what you see and tell me where I am."
-            
-        # Save image to disk
-        fname = f"frame_{datetime.now().strftime('%H%M%S')}.jpg"
-        path = os.path.join('static', fname)
-        
+        blank = np.zeros((DETECT_SIZE * 3 // 4, DETECT_SIZE, 3), dtype=np.uint8)
+        started = time.perf_counter()
+        if WARMUP_RUNS:
+            first = detector.calibrate(blank, WARMUP_RUNS)
+            startup["first_inference_ms"] = round(first * 1000, 1)
+        startup["warmup_seconds"] = round(time.perf_counter() - started, 2)
+        app.logger.info(f"✅ Detector warm after {WARMUP_RUNS} runs per variant in {startup['warmup_seconds']}s")
+        ready.set()
+    except Exception:
+        app.logger.exception("❌ Detector warmup failed")
+
+threading.Thread(target=warm_up, name="yolo-warmup", daemon=True).start()
+
+# Stage pool - Whisper, YOLO and geolocation don't depend on each other,
+# so they run side by side and only the prompt build waits on all three.
+# YOLO and geolocation complete on the batcher's and geo cache's own futures;
+# only Whisper holds a worker, so size the pool for every admitted request.
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", os.getenv("ADMISSION_MAX_ACTIVE", "32")))
+stage_pool = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+# How long a pooled stage may wait for a free worker before its own timeout starts
+STAGE_QUEUE_TIMEOUT = float(os.getenv("STAGE_QUEUE_TIMEOUT", "5"))
+
+# Per-stage timeouts (seconds), measured from when the stage starts running
+STAGE_TIMEOUTS = {
+    "whisper": float(os.getenv("WHISPER_TIMEOUT", "8")),
+    "yolo": float(os.getenv("YOLO_TIMEOUT", "5")),
+    "geo": float(os.getenv("GEO_TIMEOUT", "4")),
+}
+
+# Metrics, exposed in Prometheus text format at /metrics
+STAGE_SECONDS = metrics.Histogram("shravan_stage_seconds", "Time spent in each /query pipeline stage", ["stage"])
+REQUEST_SECONDS = metrics.Histogram("shravan_request_seconds", "End-to-end request latency", ["endpoint"])
+REQUESTS = metrics.Counter("shravan_requests_total", "Requests handled", ["endpoint", "status"])
+ERRORS = metrics.Counter("shravan_stage_errors_total", "Pipeline stage failures and timeouts", ["stage", "kind"])
+
+def decode_audio(audio_data):
+    """Raw audio bytes from an upload or a base64 data URL."""
+    if isinstance(audio_data, bytes):
+        return audio_data
+    return base64.b64decode(audio_data.split(',', 1)[1])
+
+# Voice activity detection - trim silence off push-to-talk clips, skip Whisper when nobody spoke
+VAD_ENABLED = os.getenv("VAD", "1") != "0"
+AUDIO_CLIPS = metrics.Counter("shravan_audio_clips_total", "Audio clips by what VAD did with them", ["outcome"])
+AUDIO_BYTES = metrics.Counter("shravan_audio_bytes_total", "Audio bytes received vs. sent to Whisper", ["direction"])
+
+def prepare_audio(audio_data):
+    """Decoded clip, trimmed to its speech; ``clip.speech`` is False when there's nothing to transcribe."""
+    audio_bytes = decode_audio(audio_data)
+    clip = prepare_clip(audio_bytes) if VAD_ENABLED else Clip(audio_bytes, sniff_filename(audio_bytes))
+    if not clip.speech:
+        outcome = "silent"
+    elif clip.data is audio_bytes:
+        outcome = "passthrough"
+    else:
+        outcome = "trimmed"
+        app.logger.info(f"VAD kept {clip.kept:.1f}s of {clip.duration:.1f}s, {len(audio_bytes)} -> {len(clip.data)} bytes")
+    AUDIO_CLIPS.inc(outcome=outcome)
+    AUDIO_BYTES.inc(len(audio_bytes), direction="received")
+    AUDIO_BYTES.inc(len(clip.data), direction="uploaded")
+    return clip
+
+def transcribe_audio(audio_data):
+    """Transcribe an audio clip (raw bytes or a base64 data URL) with Whisper."""
+    clip = prepare_audio(audio_data)
+    if not clip.speech:
+        app.logger.info("No speech in audio clip, skipping Whisper")
+        return ""
+
+    # Upload straight from memory; the filename only tells Whisper the format
+    app.logger.info("Transcribing audio with Whisper")
+    transcription = openai_client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(clip.filename, clip.data)
+    )
+    app.logger.info(f"Whisper transcription: {transcription.text}")
+    return transcription.text
+
+# Frame sizes: YOLO's input size (DETECT_SIZE above), and the longest side we send to the vision model
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", "1024"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+
+def fit_within(size, max_side):
+    """Scale ``(w, h)`` down so the longest side is at most ``max_side``."""
+    w, h = size
+    scale = min(1.0, max_side / max(w, h))
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+class Frame:
+    """A camera frame decoded once and kept in memory for the whole request."""
+
+    def __init__(self, jpeg, data_url=None):
+        # Returned to the client so follow-up questions can refer back to this frame
+        self.id = uuid.uuid4().hex
+        self.jpeg = jpeg
+        img = Image.open(io.BytesIO(jpeg))
+        self.original_size = img.size
+        # Let the JPEG decoder skip resolution neither model will use
+        img.draft('RGB', fit_within(img.size, max(DETECT_SIZE, VISION_MAX_SIDE)))
+        self.image = img.convert('RGB')
+
+        # Vision-call copy; the client's JPEG is only forwarded as-is when it's already small enough
+        vision_size = fit_within(self.original_size, VISION_MAX_SIDE)
+        self.vision_image = self.image if self.image.size == vision_size else self.image.resize(vision_size, Image.BILINEAR)
+        self._resized_for_vision = vision_size != self.original_size
+        self._data_url = None if self._resized_for_vision else data_url
+
+        # Detector copy at YOLO's input size; boxes come back in these coordinates
+        detect_size = fit_within(self.original_size, DETECT_SIZE)
+        self.detect_image = self.image if self.image.size == detect_size else self.image.resize(detect_size, Image.BILINEAR)
+        self.width, self.height = self.detect_image.size
+        # Ultralytics treats numpy input as OpenCV-style BGR
+        self.array = np.ascontiguousarray(np.asarray(self.detect_image)[:, :, ::-1])
+        self._dhash = None
+
+    @classmethod
+    def from_data_url(cls, data_url):
+        """Build a frame from the client's ``data:image/jpeg;base64,...`` payload."""
+        if data_url.startswith('data:'):
+            return cls(base64.b64decode(data_url.split(',', 1)[1]), data_url=data_url)
+        return cls(base64.b64decode(data_url))
+
+    @classmethod
+    def from_upload(cls, image):
+        """Build a frame from a raw JPEG upload or a base64 data URL."""
+        if isinstance(image, bytes):
+            return cls(image)
+        return cls.from_data_url(image)
+
+    @property
+    def data_url(self):
+        """Data URL for the vision call, reusing the client's payload when we have it."""
+        if self._data_url is None:
+            payload = self.jpeg
+            if self._resized_for_vision:
+                buf = io.BytesIO()
+                self.vision_image.save(buf, 'JPEG', quality=VISION_JPEG_QUALITY)
+                payload = buf.getvalue()
+            self._data_url = f"data:image/jpeg;base64,{base64.b64encode(payload).decode('utf-8')}"
+        return self._data_url
+
+    @property
+    def dhash(self):
+        """Perceptual hash used to spot near-identical frames."""
+        if self._dhash is None:
+            self._dhash = dhash(self.detect_image)
+        return self._dhash
+
+    def compact(self):
+        """Drop the full-size decode and detector copies; the frame can still go to the vision call."""
+        if self.array is not None:
+            self.dhash  # needs the detector copy, so hash before dropping it
+            self.image = self.detect_image = self.array = None
+
+    @property
+    def nbytes(self):
+        """Rough memory held by the frame."""
+        size = len(self.jpeg) + self.vision_image.width * self.vision_image.height * 3 + len(self._data_url or '')
+        if self.array is not None:
+            size += self.array.nbytes + self.image.width * self.image.height * 3
+        return size
+
+# Detections below this confidence are dropped before anything downstream sees them
+DETECT_MIN_CONF = float(os.getenv("DETECT_MIN_CONF", "0.3"))
+
+class Detections:
+    """YOLO output for one frame: class names plus boxes (xyxy, detector coordinates) and confidences.
+
+    ``summary`` is the compact spatial description used in the prompt ("3 people center-near, car left-far").
+    """
+
+    def __init__(self, names, boxes, conf, summary=''):
+        self.names = names
+        self.boxes = boxes
+        self.conf = conf
+        self.summary = summary
+
+def to_detections(res):
+    """Detections from one YOLO ``Results`` object, filtered and summarized in one vectorized pass."""
+    objects, boxes, conf, summary = postprocess(res, min_conf=DETECT_MIN_CONF)
+    app.logger.info(f"Detected: {summary or 'nothing recognizable'}")
+    return Detections(objects, boxes, conf, summary)
+
+# Geolocation providers, tried in order (overridable to point at a local stub)
+IPINFO_URL = os.getenv("IPINFO_URL", "https://ipinfo.io")
+IP_API_URL = os.getenv("IP_API_URL", "http://ip-api.com")
+IPAPI_CO_URL = os.getenv("IPAPI_CO_URL", "https://ipapi.co")
+
+def fetch_location(ip):
+    """Look up ``ip`` (or the server itself when empty), falling back across several services."""
+    providers = [
+        # First try ipinfo.io
+        (f"{IPINFO_URL}/{ip}/json" if ip else f"{IPINFO_URL}/json",
+         lambda loc: 'bogon' not in loc and 'error' not in loc),
+        # Fallback to ip-api
+        (f"{IP_API_URL}/json/{ip}" if ip else f"{IP_API_URL}/json",
+         lambda loc: loc.get('status') == 'success'),
+        # Last resort, try ipapi.co
+        (f"{IPAPI_CO_URL}/{ip}/json/" if ip else f"{IPAPI_CO_URL}/json/",
+         lambda loc: not loc.get('error')),
+    ]
+    for url, ok in providers:
         try:
-            # Decode and save the image
-            img_data = base64.b64decode(img_b64.split(',', 1)[1])
-            with open(path, 'wb') as f:
-                f.write(img_data)
-            app.logger.info(f"Saved image {path}")
-            
-            # Convert to base64 for GPT-4o vision
-            with open(path, "rb") as img_file:
-                base64_image = base64.b64encode(img_file.read()).decode('utf-8')
+            loc = upstream.get_json(url, timeout=3)
         except Exception as e:
-            app.logger.error(f"Image processing error: {e}")
-            return jsonify(error=f"Image processing error: {e}"), 500
+            app.logger.warning(f"Geolocation provider {url} failed: {e}")
+            continue
+        if ok(loc):
+            break
+    else:
+        raise RuntimeError("All geolocation providers failed")
+
+    # Format location based on available data
+    city = loc.get('city') or loc.get('regionName', 'Unknown city')
+    country = loc.get('country') or loc.get('country_name', 'Unknown country')
+    location = f"You are in {city}, {country}"
+
+    # Add more detailed location info if available
+    lat = loc.get('lat') or loc.get('latitude')
+    lon = loc.get('lon') or loc.get('longitude')
+    if lat and lon:
+        location += f". Coordinates: {lat}, {lon}"
+
+    app.logger.info(f"Location: {location}")
+    return location
+
+# Geolocation cache - the answer almost never changes between frames from the same client
+geo_cache = GeoCache(
+    fetch_location,
+    ttl=float(os.getenv("GEO_CACHE_TTL", "900")),
+    negative_ttl=float(os.getenv("GEO_CACHE_NEGATIVE_TTL", "60")),
+    max_entries=int(os.getenv("GEO_CACHE_SIZE", "1024")),
+    # Every miss across the server runs here, one provider chain per worker
+    workers=int(os.getenv("GEO_WORKERS", os.getenv("UPSTREAM_POOL_SIZE", "32"))),
+)
+
+def caller_address():
+    """The caller's address as seen through any proxy."""
+    return request.headers.get('X-Forwarded-For', request.remote_addr or '')
+
+def client_ip(address=None):
+    """Public IP of the caller, or '' for LAN/loopback clients (looked up as the server's own location)."""
+    ip = (address if address is not None else caller_address()).split(',')[0].strip()
+    try:
+        return ip if ipaddress.ip_address(ip).is_global else ''
+    except ValueError:
+        return ''
+
+def stage_future(stage, timeout=None):
+    """A Future for one pipeline stage, due ``timeout`` seconds (default: the stage's own) from now."""
+    future = Future()
+    future.stage = stage
+    future.deadline = time.monotonic() + (STAGE_TIMEOUTS[stage] if timeout is None else timeout)
+    return future
 
-        # Object detection with YOLO
+def submit_stage(timer, stage, fn, *args):
+    """Run a blocking stage on the stage pool; its timeout counts from when a worker picks it up."""
+    future = stage_future(stage, STAGE_QUEUE_TIMEOUT + STAGE_TIMEOUTS[stage])
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        future.deadline = time.monotonic() + STAGE_TIMEOUTS[stage]
         try:
-            res = model(path)[0]
-            cls = res.boxes.cls
-            names = res.names
-            
-            # Get all detected objects, not just the first one
-            objects = []
-            if cls.nelement() > 0:
-                for c in cls:
-                    objects.append(names[int(c)])
-                obj_str = ", ".join(objects)
-            else:
-                obj_str = 'nothing recognizable'
-            
-            app.logger.info(f"Detected: {obj_str}")
+            with timer.stage(stage):
+                result = fn(*args)
         except Exception as e:
-            app.logger.error(f"YOLO detection error: {e}")
-            obj_str = "Error in object detection"
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+    stage_pool.submit(run)
+    return future
+
+def chain_stage(timer, stage, source, convert):
+    """A stage finished by ``convert(result)`` when ``source`` completes, without holding a worker."""
+    started = time.perf_counter()
+    future = stage_future(stage)
 
-        # Geolocation - alternative implementation with multiple services
+    def done(source):
+        timer.record(stage, time.perf_counter() - started)
         try:
-            # First try ipinfo.io
-            loc = requests.get('https://ipinfo.io/json', timeout=3).json()
-            if 'bogon' in loc or 'error' in loc:
-                # Fallback to ip-api
-                loc = requests.get('http://ip-api.com/json', timeout=3).json()
-                if loc.get('status') != 'success':
-                    # Last resort, try ipapi.co
-                    loc = requests.get('https://ipapi.co/json/', timeout=3).json()
-                    
-            # Format location based on available data
-            city = loc.get('city') or loc.get('regionName', 'Unknown city')
-            country = loc.get('country') or loc.get('country_name', 'Unknown country')
-            location = f"You are in {city}, {country}"
-                
-            # Add more detailed location info if available
-            lat = loc.get('lat') or loc.get('latitude')
-            lon = loc.get('lon') or loc.get('longitude')
-            if lat and lon:
-                location += f". Coordinates: {lat}, {lon}"
-                
-            app.logger.info(f"Location: {location}")
+            future.set_result(convert(source.result()))
         except Exception as e:
-            app.logger.exception("Geolocation error")
-            location = 'Current location unavailable.'
+            future.set_exception(e)
+    source.add_done_callback(done)
+    return future
+
+def detect_stage(timer, frame):
+    """YOLO on the in-memory frame; completes on the batcher's future."""
+    return chain_stage(timer, "yolo", detector.submit(frame.array), to_detections)
+
+def locate_stage(timer, ip):
+    """Cached geolocation for a client IP; cache hits resolve inline."""
+    return chain_stage(timer, "geo", geo_cache.get_future(ip), lambda location: location or STAGE_DEFAULTS["geo"])
+
+def join_stage(future, default):
+    """Wait for a stage until its deadline; fall back to ``default`` on timeout or error."""
+    if future is None:
+        return default
+    try:
+        return future.result(timeout=max(0.0, future.deadline - time.monotonic()))
+    except FuturesTimeout:
+        app.logger.warning(f"{future.stage} stage timed out after {STAGE_TIMEOUTS[future.stage]}s")
+        ERRORS.inc(stage=future.stage, kind="timeout")
+    except Exception as e:
+        app.logger.error(f"{future.stage} stage failed: {e}", exc_info=True)
+        ERRORS.inc(stage=future.stage, kind="error")
+    return default
+
+# What each stage falls back to when it times out or fails
+STAGE_DEFAULTS = {
+    "whisper": "",  # Empty if transcription fails
+    "yolo": None,
+    "geo": 'Current location unavailable.',
+}
+
+def resolved_stage(stage, value):
+    """A stage that is already done, for results carried over from an earlier request."""
+    future = stage_future(stage, 0)
+    future.set_result(value)
+    return future
+
+def iter_stages(stages):
+    """Yield ``(stage, result)`` for each running stage as soon as it finishes or hits its deadline."""
+    pending = set(stages.values())
+    while pending:
+        timeout = max(0.0, min(f.deadline for f in pending) - time.monotonic())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            done = {f for f in pending if f.deadline <= time.monotonic()}
+            pending -= done
+        for future in done:
+            yield future.stage, join_stage(future, STAGE_DEFAULTS[future.stage])
+
+def parse_query_request():
+    """Read a query body: JSON with base64 data URLs, a multipart form, or a raw image/jpeg body."""
+    if request.mimetype == 'multipart/form-data':
+        data = request.form.to_dict()
+        for field in ('image', 'audio'):
+            if field in request.files:
+                data[field] = request.files[field].read()
+    elif request.mimetype in ('image/jpeg', 'application/octet-stream'):
+        # Other fields (text, session_id, ...) ride along in the query string
+        data = request.args.to_dict()
+        data['image'] = request.get_data()
+    else:
+        data = request.get_json(force=True)
+    return check_record_flag(data, request.remote_addr, request.headers.get('X-Recorder-Token'))
+
+def flag(data, name):
+    """Boolean request field that may arrive as JSON true or a form/query string."""
+    value = data.get(name)
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+class QueryError(Exception):
+    """A request we can't process, with the HTTP status to answer it with."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+def start_query(data, timer):
+    """Validate the body, decode the frame and fan out Whisper, YOLO and geolocation."""
+    audio_data = data.get('audio', '')  # Get audio data if present
+    speech = data.get('text', '')
+    image = data.get('image', '')  # base64 data URL, or raw JPEG bytes from a binary upload
+
+    recalled = recall_frame(data)
+    if not image and recalled is None:
+        raise QueryError("Missing image data", 400)
+
+    # Kick off the independent stages first so they overlap with frame decoding
+    stages = {}
+    if audio_data and not speech:
+        stages["whisper"] = submit_stage(timer, "whisper", transcribe_audio, audio_data)
+    if recalled is not None:
+        # Follow-up question: the frame, detections and location are already known
+        stages["yolo"] = resolved_stage("yolo", recalled.detections)
+        stages["geo"] = resolved_stage("geo", recalled.location)
+        return recalled.frame, stages
+    stages["geo"] = locate_stage(timer, client_ip())
+
+    # Decode the frame once; everything downstream works from memory
+    try:
+        with timer.stage("decode"):
+            frame = Frame.from_upload(image)
+        app.logger.info(f"Decoded frame {frame.original_size[0]}x{frame.original_size[1]} -> {frame.width}x{frame.height}")
+    except Exception as e:
+        app.logger.error(f"Image processing error: {e}")
+        ERRORS.inc(stage="decode", kind="error")
+        raise QueryError(f"Image processing error: {e}", 500)
+
+    # Object detection with YOLO
+    stages["yolo"] = detect_stage(timer, frame)
+    return frame, stages
+
+class QueryContext:
+    """Everything the prompt build and GPT call need, once every stage has reported."""
+
+    def __init__(self, data, frame, speech, detections, location, history=()):
+        self.data = data
+        self.frame = frame
+        self.speech = speech
+        self.location = location
+        # Earlier (question, reply) pairs about this same frame
+        self.history = history
+        self.objects_ok = detections is not None
+        if self.objects_ok:
+            self.detections = detections
+            self.obj_str = detections.summary or 'nothing recognizable'
+        else:
+            self.detections = Detections([], np.zeros((0, 4)), np.zeros(0))
+            self.obj_str = "Error in object detection"
+        self.objects = self.detections.names
+        # Continuous mode: frames the client sends on its own timer, not in answer to a question
+        self.continuous = flag(data, 'continuous')
+        self.use_scene_cache = SCENE_CACHE_ENABLED and self.objects_ok and not flag(data, 'bypass_cache')
+        self.scene_diff = None
+        # Replies for changed continuous-mode scenes depend on the diff, and follow-ups on the
+        # conversation so far, so neither is shared. Safety questions ("is it safe to cross")
+        # are always answered from this user's own frame.
+        self.use_reply_cache = REPLY_CACHE_ENABLED and self.objects_ok and not self.continuous and \
+            not self.history and not is_safety_question(speech) and not flag(data, 'bypass_cache')
+
+def finish_stages(data, frame, results, session):
+    """Fill in stage defaults and derive the prompt inputs once every stage has reported."""
+    speech = results.get("whisper", data.get('text', ''))
+
+    # If we still don't have speech, set a default
+    if not speech.strip():
+        speech = "Describe what you see and tell me where I am."
+    return QueryContext(data, frame, speech, results.get("yolo"), results.get("geo", STAGE_DEFAULTS["geo"]),
+                        contexts.history(session, frame.id))
+
+# Vision payload budget - image tokens per request, JPEG quality for high/low detail
+VISION_TOKEN_BUDGET = int(os.getenv("VISION_TOKEN_BUDGET", "765"))
+VISION_LOW_QUALITY = int(os.getenv("VISION_LOW_QUALITY", "70"))
+
+def vision_payload(ctx):
+    """Crop/shrink the frame for the vision call based on the question and detections."""
+    payload = plan_payload(ctx.frame, ctx.speech, ctx.detections.names, ctx.detections.boxes,
+                           token_budget=VISION_TOKEN_BUDGET, quality=VISION_JPEG_QUALITY,
+                           low_quality=VISION_LOW_QUALITY)
+    app.logger.info(f"Vision payload: {payload.mode} {payload.size[0]}x{payload.size[1]} "
+                    f"detail={payload.detail} ~{payload.tokens} tokens")
+    return payload
+
+# Scene cache - near-identical frames with the same question reuse the last reply
+SCENE_CACHE_ENABLED = os.getenv("SCENE_CACHE", "1") != "0"
+scene_cache = SceneCache(
+    max_entries=int(os.getenv("SCENE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("SCENE_CACHE_TTL", "30")),
+    threshold=int(os.getenv("SCENE_CACHE_THRESHOLD", "6")),
+)
+
+# Reply cache - the same question about the same objects, in the same positions, at the same place gets the same answer
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE", "1") != "0"
+reply_cache = ReplyCache(
+    max_entries=int(os.getenv("REPLY_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("REPLY_CACHE_TTL", "300")),
+    max_bytes=int(os.getenv("REPLY_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+    cell=float(os.getenv("REPLY_CACHE_CELL", "0.01")),
+)
 
+def session_key(data, address=None):
+    """Identify the caller: an explicit session id if the client sends one, else its address."""
+    return data.get('session_id') or (address if address is not None else caller_address())
+
+# Admission control - bounded work and queue, per-client limits, safety and spoken questions served first
+admission = AdmissionController(
+    max_active=int(os.getenv("ADMISSION_MAX_ACTIVE", "32")),
+    max_queue=int(os.getenv("ADMISSION_QUEUE", "64")),
+    queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5")),
+    per_client=int(os.getenv("ADMISSION_PER_CLIENT", "8")),
+    rate=float(os.getenv("ADMISSION_RATE", "10")),
+    burst=int(os.getenv("ADMISSION_BURST", "20")),
+)
+
+# Per-client limits apply to the connection's address. Behind a reverse proxy, set TRUST_PROXY=1
+# so the address the proxy appends to X-Forwarded-For is used instead of the proxy's own.
+TRUST_PROXY = os.getenv("TRUST_PROXY", "0") == "1"
+
+def admission_client(peer, forwarded=''):
+    """Who admission limits are charged to; never a client-chosen session id or spoofable header entry."""
+    if TRUST_PROXY and forwarded:
+        return forwarded.split(',')[-1].strip()
+    return peer or ''
+
+def request_client():
+    return admission_client(request.remote_addr, request.headers.get('X-Forwarded-For', ''))
+
+def query_priority(data):
+    """Safety questions jump the admission queue.
+
+    A voice question arrives as audio only, so it can't be checked for
+    safety words before admission; explicit spoken questions still go
+    ahead of routine continuous-mode frames.
+    """
+    text = data.get('text', '')
+    if is_safety_question(text):
+        return SAFETY
+    if data.get('audio') and not text and not flag(data, 'continuous'):
+        return SPOKEN
+    return NORMAL
+
+def shed_response(e):
+    """Fast 429/503 for a request admission control turned away."""
+    response = jsonify(error=str(e))
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# Single-flight - identical bodies from one session arriving while the first is in flight share its result
+flights = SingleFlight()
+
+def query_key(data, address=None):
+    """Coalescing key for a /query body: session, frame (or frame id), question and mode."""
+    return request_key(session_key(data, address), data.get('image', ''), data.get('frame_id', ''),
+                       data.get('text', ''), data.get('audio'), flag(data, 'continuous'), flag(data, 'timings'))
+
+# Continuous mode - per-session object tracks, GPT-4o only hears about frames that changed
+trackers = TrackerRegistry(
+    max_sessions=int(os.getenv("TRACKER_SESSIONS", "1000")),
+    idle_ttl=float(os.getenv("TRACKER_IDLE_TTL", "300")),
+    min_overlap=float(os.getenv("TRACKER_MIN_OVERLAP", "0.3")),
+    max_misses=int(os.getenv("TRACKER_MAX_MISSES", "2")),
+    approach_growth=float(os.getenv("TRACKER_APPROACH_GROWTH", "1.3")),
+    max_quiet=float(os.getenv("TRACKER_MAX_QUIET", "30")),
+)
+SKIPPED_FRAMES = metrics.Counter("shravan_unchanged_frames_total", "Continuous-mode frames answered without GPT-4o")
+
+def local_reply(ctx, session):
+    """A reply that needs no GPT-4o call: an unchanged continuous-mode scene, or a scene or reply cache hit."""
+    if ctx.continuous and ctx.objects_ok:
+        ctx.scene_diff = trackers.update(session, ctx.detections.names, ctx.detections.boxes)
+        if not ctx.scene_diff.significant:
+            app.logger.info("No scene change, skipping GPT")
+            SKIPPED_FRAMES.inc()
+            return ctx.scene_diff.summary()
+        # Something new, gone or approaching: a cached reply for a similar frame would describe the old scene
+        ctx.use_scene_cache = ctx.use_reply_cache = False
+    if ctx.use_scene_cache:
+        reply = scene_cache.get(session, ctx.frame.dhash, ctx.objects, ctx.speech)
+        if reply is not None:
+            app.logger.info(f"Scene cache hit: {reply}")
+            return reply
+    if ctx.use_reply_cache:
+        reply = reply_cache.get(ctx.detections.summary, ctx.location, ctx.speech)
+        if reply is not None:
+            app.logger.info(f"Reply cache hit: {reply}")
+            return reply
+    return None
+
+def remember_reply(ctx, session, reply):
+    """Record a fresh GPT-4o reply in the caches and the session's tracks."""
+    if ctx.use_scene_cache:
+        scene_cache.put(session, ctx.frame.dhash, ctx.objects, ctx.speech, reply)
+    if ctx.use_reply_cache:
+        reply_cache.put(ctx.detections.summary, ctx.location, ctx.speech, reply)
+    if ctx.scene_diff is not None:
+        trackers.mark_narrated(session)
+
+# Session context - each session's last frame and conversation, so follow-ups can skip upload and detection
+contexts = SessionContexts(
+    max_sessions=int(os.getenv("CONTEXT_SESSIONS", "1000")),
+    max_bytes=int(os.getenv("CONTEXT_MAX_MB", "256")) * 1024 * 1024,
+    idle_ttl=float(os.getenv("CONTEXT_IDLE_TTL", "300")),
+    max_turns=int(os.getenv("CONTEXT_TURNS", "4")),
+)
+FOLLOW_UPS = metrics.Counter("shravan_follow_up_queries_total", "Queries about an earlier frame by id", ["outcome"])
+
+def recall_frame(data, address=None):
+    """The stored context a follow-up refers to by ``frame_id``, or None when the request brings its own image."""
+    frame_id = data.get('frame_id')
+    if not frame_id or data.get('image'):
+        return None
+    recalled = contexts.recall(session_key(data, address), frame_id)
+    if recalled is None:
+        FOLLOW_UPS.inc(outcome="expired")
+        raise QueryError(f"Frame {frame_id} is no longer available, send the image again", 410)
+    FOLLOW_UPS.inc(outcome="answered")
+    app.logger.info(f"Follow-up on frame {frame_id}, skipping decode, detection and geolocation")
+    return recalled
+
+def remember_turn(ctx, session, reply):
+    """Keep the frame and this exchange as the session's context for follow-up questions."""
+    ctx.frame.compact()
+    contexts.remember(session, ctx.frame.id, ctx.frame, ctx.detections if ctx.objects_ok else None,
+                      ctx.location, ctx.speech, reply, ctx.frame.nbytes)
+
+def describe_changes(diff):
+    """One prompt line listing what changed since the user was last told about the scene."""
+    if diff is None:
+        return ""
+    parts = [f"{label}: {', '.join(names)}" for label, names in
+             (("New", diff.new), ("Gone", diff.gone), ("Getting closer", diff.approaching)) if names]
+    return "Changes since the last description: " + ("; ".join(parts) if parts else "none") + \
+        ". Mention only these changes unless something is dangerous."
+
+def query_result(ctx, reply, cached):
+    """JSON body shared by /query and the /query/stream done event."""
+    result = {
+        "reply": reply,
+        "objects": ctx.objects,
+        "location": ctx.location,
+        "speech_recognized": ctx.speech,
+        "cached": cached,
+        "frame_id": ctx.frame.id
+    }
+    if ctx.scene_diff is not None:
+        result["scene_changed"] = ctx.scene_diff.significant
+        result["changes"] = ctx.scene_diff.to_dict()
+    return result
+
+# Flight recorder - opt-in ring buffer of recent queries per session, dumped to disk for offline replay
+FLIGHT_RECORDER_ALL = os.getenv("FLIGHT_RECORDER", "0") == "1"
+FLIGHT_RECORDER_DIR = os.getenv("FLIGHT_RECORDER_DIR", "recordings")
+recorder = FlightRecorder(
+    per_session=int(os.getenv("FLIGHT_RECORDER_PER_SESSION", "20")),
+    max_bytes=int(os.getenv("FLIGHT_RECORDER_MAX_MB", "64")) * 1024 * 1024,
+)
+
+# Recording and dumping users' frames is for operators: callers on loopback (RECORDER_ALLOW_LOOPBACK)
+# or sending the X-Recorder-Token header matching RECORDER_TOKEN
+RECORDER_TOKEN = os.getenv("RECORDER_TOKEN", "")
+RECORDER_ALLOW_LOOPBACK = os.getenv("RECORDER_ALLOW_LOOPBACK", "1") != "0"
+
+def recorder_allowed(peer, token=None):
+    """Whether the directly connected ``peer`` may turn recording on or dump the recorder."""
+    if RECORDER_TOKEN and token and hmac.compare_digest(token, RECORDER_TOKEN):
+        return True
+    if not RECORDER_ALLOW_LOOPBACK:
+        return False
+    try:
+        return ipaddress.ip_address(peer or '').is_loopback
+    except ValueError:
+        return False
+
+def check_record_flag(data, peer, token=None):
+    """Drop a request's ``record`` flag unless the caller may use the recorder."""
+    if isinstance(data, dict) and 'record' in data and not recorder_allowed(peer, token):
+        del data['record']
+    return data
+
+def record_flight(data, ctx, timer, session, prompt=None, reply=None, cached=False, error=None):
+    """Keep this query in the session's flight recorder when recording is on for it."""
+    if not (FLIGHT_RECORDER_ALL or flag(data, 'record')):
+        return
+    audio = data.get('audio')
+    meta = {
+        "text": data.get('text', ''),
+        "flags": {name: flag(data, name) for name in ('continuous', 'bypass_cache')},
+        "speech": ctx.speech,
+        "objects": ctx.objects,
+        "boxes": np.round(ctx.detections.boxes, 1).tolist(),
+        "conf": np.round(ctx.detections.conf, 3).tolist(),
+        "location": ctx.location,
+        "prompt": prompt.to_dict() if prompt else None,
+        "reply": reply,
+        "cached": cached,
+        "error": error,
+        "timings": timer.breakdown(),
+    }
+    recorder.record(session, meta, ctx.frame.jpeg, decode_audio(audio) if audio else b"")
+
+def dump_flights(session=None):
+    """Write the flight recorder (one session or all) to a new archive under FLIGHT_RECORDER_DIR."""
+    os.makedirs(FLIGHT_RECORDER_DIR, exist_ok=True)
+    path = os.path.join(FLIGHT_RECORDER_DIR, f"flights_{int(time.time() * 1000)}.zip")
+    count = recorder.dump(path, session)
+    app.logger.info(f"Dumped {count} recorded queries to {path}")
+    return path, count
+
+# Prompt token budget per section (speech, objects, location, changes, history)
+PROMPT_BUDGETS = {name: int(os.getenv(f"PROMPT_{name.upper()}_TOKENS", str(budget)))
+                  for name, budget in prompt_builder.SECTION_BUDGETS.items()}
+GPT_TOKENS = metrics.Counter("shravan_gpt_tokens_total", "GPT-4o tokens by kind", ["kind"])
+
+def build_prompt(speech, obj_str, location, changes="", history=()):
+    """Prompt for the GPT-4o vision call: fixed system instructions, budgeted user sections."""
+    return prompt_builder.build(speech, obj_str, location, changes, history, budgets=PROMPT_BUDGETS)
+
+def gpt_messages(prompt, payload):
+    """Chat messages for the GPT-4o vision call.
+
+    Most stable first, so OpenAI's prompt cache can reuse the prefix: the
+    system message is identical on every request, the image is the same for
+    follow-ups on one frame, and the user text (earlier turns first) comes last.
+    """
+    return [
+        {
+            "role": "system",
+            "content": prompt.system
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": payload.url,
+                        "detail": payload.detail
+                    }
+                },
+                {
+                    "type": "text", 
+                    "text": prompt.user
+                }
+            ]
+        }
+    ]
+
+def note_usage(prompt, usage):
+    """Attach the call's token usage to the prompt and count it."""
+    prompt.usage = prompt_builder.read_usage(usage)
+    if prompt.usage:
+        GPT_TOKENS.inc(prompt.usage["prompt_tokens"], kind="prompt")
+        GPT_TOKENS.inc(prompt.usage["completion_tokens"], kind="completion")
+        GPT_TOKENS.inc(prompt.usage["cached_tokens"], kind="cached")
+        app.logger.info(f"GPT tokens: {prompt.usage['prompt_tokens']} prompt "
+                        f"({prompt.usage['cached_tokens']} cached), {prompt.usage['completion_tokens']} completion")
+
+def ask_gpt(prompt, payload):
+    """Send the prompt and image to GPT-4o and return the reply text."""
+    # Use GPT-4o with vision
+    response = openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=gpt_messages(prompt, payload),
+        max_tokens=300
+    )
+    note_usage(prompt, response.usage)
+
+    reply = response.choices[0].message.content.strip()
+    app.logger.info(f"GPT response: {reply}")
+    return reply
+
+# A sentence ends at . ! or ? followed by whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def stream_gpt_sentences(prompt, payload):
+    """Stream the GPT-4o reply, yielding it one complete sentence at a time."""
+    stream = openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=gpt_messages(prompt, payload),
+        max_tokens=300,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    buffer = ""
+    for chunk in stream:
+        # Usage arrives on a final chunk with no choices
+        if getattr(chunk, "usage", None):
+            note_usage(prompt, chunk.usage)
+        if not chunk.choices:
+            continue
+        buffer += chunk.choices[0].delta.content or ""
+        *sentences, buffer = SENTENCE_END.split(buffer)
+        for sentence in sentences:
+            if sentence.strip():
+                yield sentence.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+def sse(event, payload):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def stage_event(stage, value):
+    """``(event, payload)`` announcing one finished stage on the /query/stream channel."""
+    if stage == "yolo":
+        return "objects", {"objects": value.names if value else []}
+    if stage == "geo":
+        return "location", {"location": value}
+    return "speech", {"speech_recognized": value}
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+def answer_query(data, timer):
+    """The full /query pipeline for one parsed body; returns the response dict or raises QueryError."""
+    frame, stages = start_query(data, timer)
+
+    # Join all stages before building the prompt
+    session = session_key(data)
+    results = dict(iter_stages(stages))
+    ctx = finish_stages(data, frame, results, session)
+
+    # Skip GPT-4o entirely when the user is still looking at the same scene
+    reply = local_reply(ctx, session)
+    cached = reply is not None
+    prompt = None
+    if not cached:
         # GPT-4o with vision capabilities
         try:
-            prompt = f"""
-You are an AI assistant for a visually impaired person. 
-User said: "{speech}"
-Detected objects in view: {obj_str}
-{location}
-
-Provide an extremely concise response (2-3 short sentences max) that:
-1. Mentions critical obstacles or dangers first if any exist
-2. Very briefly describes only the most important elements of the scene
-3. Answers the user's specific question directly
-4. Uses simple language and avoids unnecessary details
-
-Keep responses under 30 words whenever possible. Be direct and prioritize safety information.
-"""
-            # Use GPT-4o with vision
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text", 
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=300
-            )
-            
-            reply = response.choices[0].message.content.strip()
-            app.logger.info(f"GPT response: {reply}")
-            
+            with timer.stage("prompt"):
+                prompt = build_prompt(ctx.speech, ctx.obj_str, ctx.location, describe_changes(ctx.scene_diff),
+                                      ctx.history)
+                payload = vision_payload(ctx)
+            with timer.stage("gpt"):
+                reply = ask_gpt(prompt, payload)
         except Exception as oe:
             app.logger.error(f"OpenAI API call failed: {oe}", exc_info=True)
-            # cleanup the saved frame even on error
-            try:
-                os.remove(path)
-                app.logger.info(f"Deleted frame after error: {path}")
-            except Exception as rm_err:
-                app.logger.warning(f"Failed to delete frame: {path} - {rm_err}")
-            return jsonify(error=f"OpenAI API error: {str(oe)}"), 502
+            ERRORS.inc(stage="gpt", kind="error")
+            record_flight(data, ctx, timer, session, prompt, error=str(oe))
+            raise QueryError(f"OpenAI API error: {str(oe)}", 502)
+        remember_reply(ctx, session, reply)
+    remember_turn(ctx, session, reply)
 
-        # Clean up saved file after processing
+    # Return detailed response to client
+    result = query_result(ctx, reply, cached)
+    if flag(data, 'timings'):
+        result["timings"] = timer.breakdown()
+        result["usage"] = prompt.usage if prompt else None
+    record_flight(data, ctx, timer, session, prompt, reply, cached)
+    return result
+
+def answer_admitted(data, timer, client):
+    """answer_query once admission control lets the request in."""
+    with admission.admit(client, query_priority(data)):
+        return answer_query(data, timer)
+
+@app.route('/query', methods=['POST'])
+def query():
+    try:
+        timer = StageTimer(STAGE_SECONDS)
+        with timer.stage("parse"):
+            data = parse_query_request()
+        # Double taps and client retries share the answer already being worked on
         try:
-            os.remove(path)
-            app.logger.info(f"Deleted frame: {path}")
-        except Exception as rm_e:
-            app.logger.warning(f"Failed to delete frame: {path} - {rm_e}")
-            
-        # Return detailed response to client
-        return jsonify({
-            "reply": reply,
-            "objects": objects if cls.nelement() > 0 else [],
-            "location": location,
-            "speech_recognized": speech
-        })
+            result, shared = flights.do(query_key(data), answer_admitted, data, timer, request_client())
+        except Rejected as e:
+            return shed_response(e)
+        except QueryError as e:
+            return jsonify(error=str(e)), e.status
+        if shared:
+            app.logger.info("Duplicate /query coalesced with the one in flight")
+        return jsonify(result)
         
     except Exception as e:
         app.logger.exception("Query handler error")
         return jsonify(error=str(e)), 500
 
+@app.route('/query/stream', methods=['POST'])
+def query_stream():
+    """Streaming /query: Server-Sent Events for each stage result, then the reply sentence by sentence."""
+    try:
+        timer = StageTimer(STAGE_SECONDS)
+        with timer.stage("parse"):
+            data = parse_query_request()
+        # The slot is held until the stream finishes
+        ticket = admission.admit(request_client(), query_priority(data))
+        try:
+            frame, stages = start_query(data, timer)
+        except Exception:
+            ticket.release()
+            raise
+    except Rejected as e:
+        return shed_response(e)
+    except QueryError as e:
+        return jsonify(error=str(e)), e.status
+    except Exception as e:
+        app.logger.exception("Query stream error")
+        return jsonify(error=str(e)), 500
+
+    session = session_key(data)
+
+    def generate():
+        try:
+            yield from stream_events()
+        finally:
+            ticket.release()
+
+    def stream_events():
+        # Push detections, location and transcription as each one lands
+        results = {}
+        for stage, value in iter_stages(stages):
+            results[stage] = value
+            yield sse(*stage_event(stage, value))
+        ctx = finish_stages(data, frame, results, session)
+
+        reply = local_reply(ctx, session)
+        cached = reply is not None
+        prompt = None
+        if cached:
+            yield sse("sentence", {"text": reply})
+        else:
+            sentences = []
+            try:
+                with timer.stage("prompt"):
+                    prompt = build_prompt(ctx.speech, ctx.obj_str, ctx.location, describe_changes(ctx.scene_diff),
+                                          ctx.history)
+                    payload = vision_payload(ctx)
+                with timer.stage("gpt"):
+                    for sentence in stream_gpt_sentences(prompt, payload):
+                        if not sentences:
+                            timer.record("gpt_first_sentence", time.perf_counter() - timer.started)
+                        sentences.append(sentence)
+                        yield sse("sentence", {"text": sentence})
+            except Exception as oe:
+                app.logger.error(f"OpenAI API call failed: {oe}", exc_info=True)
+                ERRORS.inc(stage="gpt", kind="error")
+                record_flight(data, ctx, timer, session, prompt, error=str(oe))
+                yield sse("error", {"error": f"OpenAI API error: {str(oe)}"})
+                return
+            reply = " ".join(sentences)
+            app.logger.info(f"GPT response: {reply}")
+            remember_reply(ctx, session, reply)
+        remember_turn(ctx, session, reply)
+
+        result = query_result(ctx, reply, cached)
+        if flag(data, 'timings'):
+            result["timings"] = timer.breakdown()
+            result["usage"] = prompt.usage if prompt else None
+        record_flight(data, ctx, timer, session, prompt, reply, cached)
+        yield sse("done", result)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/alert', methods=['POST'])
+def alert():
+    """Safety fast path: YOLO plus local rules only, never the LLM."""
+    started = time.perf_counter()
+    try:
+        data = parse_query_request()
+        image = data.get('image', '')
+        if not image:
+            return jsonify(error="Missing image data"), 400
+
+        # Alerts always get priority admission
+        with admission.admit(request_client(), SAFETY):
+            try:
+                frame = Frame.from_upload(image)
+            except Exception as e:
+                app.logger.error(f"Image processing error: {e}")
+                return jsonify(error=f"Image processing error: {e}"), 500
+
+            start = time.perf_counter()
+            res = detector.predict(frame.array, timeout=STAGE_TIMEOUTS["yolo"])
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="alert_yolo")
+        result = alerts.assess(res, frame.width, frame.height)
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if result["alert"]:
+            app.logger.info(f"Alert ({result['level']}): {result['alert']}")
+        return jsonify(result)
+
+    except Rejected as e:
+        return shed_response(e)
+    except Exception as e:
+        app.logger.exception("Alert handler error")
+        return jsonify(error=str(e)), 500
+
+# The archive holds users' frames, so it stays on the server's disk
+@app.route('/recorder/dump', methods=['POST'])
+def dump_recorder():
+    if not recorder_allowed(request.remote_addr, request.headers.get('X-Recorder-Token')):
+        return jsonify(error="Forbidden"), 403
+    data = request.get_json(silent=True) or {}
+    path, count = dump_flights(data.get('session_id'))
+    return jsonify(path=path, records=count)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streaming responses are timed up to their headers; the stage histogram covers the rest
+    endpoint = request.endpoint or "unknown"
+    if endpoint != "metrics_endpoint":
+        REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint=endpoint)
+    return response
+
+@metrics.register_collector
+def cache_metrics():
+    caches = {"geo": geo_cache.stats(), "scene": scene_cache.stats(), "reply": reply_cache.stats()}
+    out = []
+    for name, key, kind, help in (("shravan_cache_hits_total", "hits", "counter", "Cache hits"),
+                                  ("shravan_cache_misses_total", "misses", "counter", "Cache misses"),
+                                  ("shravan_cache_entries", "size", "gauge", "Entries currently cached")):
+        for cache, stats in caches.items():
+            out.append((name, kind, help, {"cache": cache}, stats[key]))
+    for key, value in upstream.stats().items():
+        client, _, what = key.partition("_")
+        if what in ("requests", "connections", "retries"):
+            out.append((f"shravan_upstream_{what}_total", "counter", f"Upstream HTTP {what}", {"client": client}, value))
+    batch = detector.stats()
+    out.append(("shravan_yolo_batches_total", "counter", "Batched YOLO forward passes", {}, batch["batches"]))
+    out.append(("shravan_yolo_frames_total", "counter", "Frames run through YOLO", {}, batch["frames"]))
+    out.append(("shravan_yolo_queue_depth", "gauge", "Frames waiting for the detector", {}, batch["queued"]))
+    out.append(("shravan_yolo_variant_switches_total", "counter", "Detector variant changes", {}, batch["switches"]))
+    for variant in batch["variants"]:
+        labels = {"variant": variant["name"]}
+        out.append(("shravan_yolo_variant_frames_total", "counter", "Frames run per detector variant", labels,
+                    variant["frames"]))
+        if variant["latency_ms"] is not None:
+            out.append(("shravan_yolo_variant_latency_seconds", "gauge", "Measured per-frame detector latency",
+                        labels, variant["latency_ms"] / 1000))
+        out.append(("shravan_yolo_variant_active", "gauge", "Detector variant currently in use", labels,
+                    int(variant["name"] == batch["variant"])))
+    adm = admission.stats()
+    out.append(("shravan_admission_active", "gauge", "Requests admitted and running", {}, adm["active"]))
+    out.append(("shravan_admission_queue_depth", "gauge", "Requests waiting for admission", {}, adm["queued"]))
+    for priority, value in adm["admitted"].items():
+        out.append(("shravan_admission_admitted_total", "counter", "Requests admitted", {"priority": priority}, value))
+    for reason, value in adm["shed"].items():
+        out.append(("shravan_admission_shed_total", "counter", "Requests shed by admission control",
+                    {"reason": reason}, value))
+    ctx_stats = contexts.stats()
+    out.append(("shravan_session_contexts", "gauge", "Sessions holding a frame for follow-ups", {},
+                ctx_stats["sessions"]))
+    out.append(("shravan_session_context_bytes", "gauge", "Memory held by session contexts", {}, ctx_stats["bytes"]))
+    out.append(("shravan_coalesced_requests_total", "counter", "Duplicate queries that shared an in-flight result",
+                {}, flights.stats()["coalesced"]))
+    return out
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Readiness - only green once the detector has been warmed up
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    if not ready.is_set():
+        return jsonify(status="starting", model=YOLO_MODEL, **startup), 503
+    return jsonify(status="ready", model=YOLO_MODEL, **startup)
+
 # Health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify(status="ok", message="Server is running")
+    return jsonify(status="ok", message="Server is running", geo_cache=geo_cache.stats(),
+                   detector=detector.stats(), scene_cache=scene_cache.stats(), reply_cache=reply_cache.stats(),
+                   trackers=trackers.stats(), single_flight=flights.stats(), admission=admission.stats(),
+                   recorder=recorder.stats(), contexts=contexts.stats(), upstream=upstream.stats())
 
 if __name__ == '__main__':
     app.logger.info("Starting Vision Assistant server on port 8501")
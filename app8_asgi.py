@@ -0,0 +1,501 @@
+"""ASGI serving mode for the app8 query pipeline.
+
+    pip install starlette "uvicorn[standard]" python-multipart
+    uvicorn app8_asgi:app --host 0.0.0.0 --port 8501
+
+Same model, detector, caches, prompt and metrics as app8, but every upstream
+call is awaited instead of holding a thread: OpenAI goes through AsyncOpenAI,
+YOLO frames are handed to the batching detector's worker thread, and frame
+decoding / image encoding run on a small CPU pool. One process can keep
+hundreds of slow upstream calls in flight.
+
+``/ws`` is a persistent channel for camera clients: frames and audio go up,
+alerts and replies come back on the same socket, and frames that arrive while
+one is being answered replace each other so replies are always about the
+newest frame. ``/query`` and ``/query/stream`` answer the same bodies as
+app8's, so clients fall back to them whenever the socket is down.
+"""
+import asyncio
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+
+import alerts
+import app8
+import metrics
+from metrics import StageTimer
+
+logger = app8.app.logger
+
+# Frame decode, vision payload encode: CPU work kept off the event loop
+cpu_pool = ThreadPoolExecutor(max_workers=int(os.getenv("ASGI_CPU_WORKERS", "4")), thread_name_prefix="asgi-cpu")
+templates = Jinja2Templates(directory='templates')
+openai_client = None  # AsyncOpenAI, created on startup inside the serving loop
+
+
+async def parse_request(request):
+    """Same body formats as app8.parse_query_request: JSON, multipart, or raw image/jpeg."""
+    content_type = request.headers.get('content-type', '').split(';')[0].strip()
+    if content_type == 'multipart/form-data':
+        form = await request.form()
+        data = {}
+        for key, value in form.items():
+            data[key] = await value.read() if hasattr(value, 'read') else value
+    elif content_type in ('image/jpeg', 'application/octet-stream'):
+        data = dict(request.query_params)
+        data['image'] = await request.body()
+    else:
+        data = await request.json()
+    return app8.check_record_flag(data, peer_address(request), request.headers.get('x-recorder-token'))
+
+
+def peer_address(conn):
+    """The directly connected peer, ignoring X-Forwarded-For (which the client controls)."""
+    return conn.client.host if conn.client else ''
+
+
+def admission_client(conn):
+    return app8.admission_client(peer_address(conn), conn.headers.get('x-forwarded-for', ''))
+
+
+async def run_in_cpu_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, fn, *args)
+
+
+async def timed_stage(timer, stage, coro):
+    """Run one stage under its app8 timeout; fall back to the stage default on timeout or error."""
+    start = asyncio.get_running_loop().time()
+    try:
+        return await asyncio.wait_for(coro, timeout=app8.STAGE_TIMEOUTS[stage])
+    except asyncio.TimeoutError:
+        logger.warning(f"{stage} stage timed out after {app8.STAGE_TIMEOUTS[stage]}s")
+        app8.ERRORS.inc(stage=stage, kind="timeout")
+    except Exception as e:
+        logger.error(f"{stage} stage failed: {e}", exc_info=True)
+        app8.ERRORS.inc(stage=stage, kind="error")
+    finally:
+        timer.record(stage, asyncio.get_running_loop().time() - start)
+    return app8.STAGE_DEFAULTS[stage]
+
+
+async def transcribe(audio_data):
+    clip = await run_in_cpu_pool(app8.prepare_audio, audio_data)
+    if not clip.speech:
+        logger.info("No speech in audio clip, skipping Whisper")
+        return ""
+    transcription = await openai_client.audio.transcriptions.create(
+        model="whisper-1",
+        file=(clip.filename, clip.data)
+    )
+    logger.info(f"Whisper transcription: {transcription.text}")
+    return transcription.text
+
+
+async def locate(ip):
+    # Hits resolve immediately; a miss waits on the cache's own lookup without blocking the loop.
+    # The lookup is shared with every request for the same IP, so a timeout here mustn't cancel it.
+    location = await asyncio.shield(asyncio.wrap_future(app8.geo_cache.get_future(ip)))
+    return location or 'Current location unavailable.'
+
+
+async def detect(frame, on_result=None):
+    res = await asyncio.wrap_future(app8.detector.submit(frame.array))
+    if on_result is not None:
+        await on_result(res, frame)
+    return app8.to_detections(res)
+
+
+async def ask_gpt(prompt, payload):
+    response = await openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=app8.gpt_messages(prompt, payload),
+        max_tokens=300
+    )
+    app8.note_usage(prompt, response.usage)
+    reply = response.choices[0].message.content.strip()
+    logger.info(f"GPT response: {reply}")
+    return reply
+
+
+async def stream_gpt_sentences(prompt, payload):
+    """Stream the GPT-4o reply, yielding it one complete sentence at a time."""
+    stream = await openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=app8.gpt_messages(prompt, payload),
+        max_tokens=300,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    buffer = ""
+    async for chunk in stream:
+        # Usage arrives on a final chunk with no choices
+        if getattr(chunk, "usage", None):
+            app8.note_usage(prompt, chunk.usage)
+        if not chunk.choices:
+            continue
+        buffer += chunk.choices[0].delta.content or ""
+        *sentences, buffer = app8.SENTENCE_END.split(buffer)
+        for sentence in sentences:
+            if sentence.strip():
+                yield sentence.strip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def answer(data, address, timer, on_detect=None, on_event=None):
+    """The /query pipeline for one parsed request; returns the response body or raises app8.QueryError.
+
+    ``on_detect(res, frame)`` is awaited with the raw YOLO result as soon as it lands.
+    ``on_event(event, payload)``, when given, is awaited with the /query/stream events
+    (each stage as it lands, then the reply sentence by sentence) and the GPT-4o
+    reply is streamed.
+    """
+    audio_data = data.get('audio', '')
+    speech = data.get('text', '')
+    image = data.get('image', '')
+    recalled = app8.recall_frame(data, address)
+    if not image and recalled is None:
+        raise app8.QueryError("Missing image data", 400)
+
+    # Fan out the independent stages; each carries its own timeout from submission
+    stages = {}
+    if audio_data and not speech:
+        stages["whisper"] = asyncio.create_task(timed_stage(timer, "whisper", transcribe(audio_data)))
+
+    if recalled is not None:
+        # Follow-up question: the frame, detections and location are already known
+        frame = recalled.frame
+        results = {"yolo": recalled.detections, "geo": recalled.location}
+    else:
+        stages["geo"] = asyncio.create_task(timed_stage(timer, "geo", locate(app8.client_ip(address))))
+        try:
+            with timer.stage("decode"):
+                frame = await run_in_cpu_pool(app8.Frame.from_upload, image)
+        except Exception as e:
+            logger.error(f"Image processing error: {e}")
+            app8.ERRORS.inc(stage="decode", kind="error")
+            for task in stages.values():
+                task.cancel()
+            raise app8.QueryError(f"Image processing error: {e}", 500)
+        stages["yolo"] = asyncio.create_task(timed_stage(timer, "yolo", detect(frame, on_detect)))
+        results = {}
+    if on_event is not None:
+        for stage, value in results.items():
+            await on_event(*app8.stage_event(stage, value))
+
+    async def landed(stage, task):
+        value = await task
+        if on_event is not None:
+            await on_event(*app8.stage_event(stage, value))
+        return value
+    results.update(zip(stages, await asyncio.gather(*(landed(stage, task) for stage, task in stages.items()))))
+
+    session = app8.session_key(data, address)
+    ctx = app8.finish_stages(data, frame, results, session)
+    reply = app8.local_reply(ctx, session)
+    cached = reply is not None
+    prompt = None
+    if cached and on_event is not None:
+        await on_event("sentence", {"text": reply})
+    if not cached:
+        try:
+            with timer.stage("prompt"):
+                prompt = app8.build_prompt(ctx.speech, ctx.obj_str, ctx.location,
+                                           app8.describe_changes(ctx.scene_diff), ctx.history)
+                payload = await run_in_cpu_pool(app8.vision_payload, ctx)
+            with timer.stage("gpt"):
+                if on_event is None:
+                    reply = await ask_gpt(prompt, payload)
+                else:
+                    sentences = []
+                    async for sentence in stream_gpt_sentences(prompt, payload):
+                        if not sentences:
+                            timer.record("gpt_first_sentence", time.perf_counter() - timer.started)
+                        sentences.append(sentence)
+                        await on_event("sentence", {"text": sentence})
+                    reply = " ".join(sentences)
+                    logger.info(f"GPT response: {reply}")
+        except Exception as oe:
+            logger.error(f"OpenAI API call failed: {oe}", exc_info=True)
+            app8.ERRORS.inc(stage="gpt", kind="error")
+            app8.record_flight(data, ctx, timer, session, prompt, error=str(oe))
+            raise app8.QueryError(f"OpenAI API error: {str(oe)}", 502)
+        app8.remember_reply(ctx, session, reply)
+    app8.remember_turn(ctx, session, reply)
+
+    result = app8.query_result(ctx, reply, cached)
+    if app8.flag(data, 'timings'):
+        result["timings"] = timer.breakdown()
+        result["usage"] = prompt.usage if prompt else None
+    app8.record_flight(data, ctx, timer, session, prompt, reply, cached)
+    return result
+
+
+async def answer_admitted(data, address, client, timer, on_detect=None, on_event=None):
+    """answer() once admission control lets the request in; ``client`` is what its limits are charged to."""
+    ticket = await app8.admission.admit_async(client, app8.query_priority(data))
+    with ticket:
+        return await answer(data, address, timer, on_detect, on_event)
+
+
+def shed_response(e):
+    return JSONResponse({"error": str(e)}, status_code=e.status, headers={"Retry-After": str(e.retry_after)})
+
+
+def remote_address(conn):
+    """Caller address for a request or websocket, honouring X-Forwarded-For like app8."""
+    return conn.headers.get('x-forwarded-for', conn.client.host if conn.client else '')
+
+
+async def query(request):
+    try:
+        timer = StageTimer(app8.STAGE_SECONDS)
+        with timer.stage("parse"):
+            data = await parse_request(request)
+        address = remote_address(request)
+        # Double taps and client retries share the answer already being worked on
+        result, shared = await app8.flights.do_async(app8.query_key(data, address), answer_admitted,
+                                                     data, address, admission_client(request), timer)
+        if shared:
+            logger.info("Duplicate /query coalesced with the one in flight")
+        return JSONResponse(result)
+    except app8.Rejected as e:
+        return shed_response(e)
+    except app8.QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status)
+    except Exception as e:
+        logger.exception("Query handler error")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def query_stream(request):
+    """Streaming /query, same Server-Sent Events as app8's: each stage as it lands, then the reply by sentence."""
+    try:
+        timer = StageTimer(app8.STAGE_SECONDS)
+        with timer.stage("parse"):
+            data = await parse_request(request)
+    except Exception as e:
+        logger.exception("Query stream error")
+        return JSONResponse({"error": str(e)}, status_code=500)
+    address = remote_address(request)
+    events = asyncio.Queue()
+
+    async def emit(event, payload):
+        await events.put(app8.sse(event, payload))
+
+    async def run():
+        try:
+            result = await answer_admitted(data, address, admission_client(request), timer, on_event=emit)
+            await emit("done", result)
+        except (app8.Rejected, app8.QueryError) as e:
+            await events.put(e)
+        except Exception as e:
+            logger.exception("Query stream error")
+            await events.put(e)
+        finally:
+            await events.put(None)
+
+    worker = asyncio.create_task(run())
+    # Failures before the first event (shed, bad body, expired frame) still get a plain HTTP error
+    first = await events.get()
+    if isinstance(first, app8.Rejected):
+        return shed_response(first)
+    if isinstance(first, Exception):
+        return JSONResponse({"error": str(first)}, status_code=getattr(first, "status", 500))
+
+    async def body():
+        item = first
+        while item is not None:
+            yield app8.sse("error", {"error": str(item)}) if isinstance(item, Exception) else item
+            item = await events.get()
+        await worker
+
+    return StreamingResponse(body(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# WebSocket channel - binary messages are b"F" + JPEG frame or b"A" + audio chunk,
+# text messages are JSON: {"type": "config", ...request fields}, {"type": "ask", "text": ..., "frame_id": ...},
+# {"type": "audio_end"}. Only the newest unanswered frame is kept; an ask with the frame_id of an
+# earlier reply is answered against that frame.
+WS_MAX_AUDIO_BYTES = int(os.getenv("WS_MAX_AUDIO_BYTES", str(4 * 1024 * 1024)))
+WS_FRAMES = metrics.Counter("shravan_ws_frames_total", "Frames received on the websocket channel", ["outcome"])
+open_channels = set()
+
+
+class FrameChannel:
+    """One websocket: settings, the newest pending frame, and a question waiting to go with it."""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.settings = {}
+        self.frame = None
+        self.question = {}
+        self.audio = bytearray()
+        self.pending = asyncio.Event()
+        self.send_lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self.send_lock:
+            await self.websocket.send_json(message)
+
+    def handle_bytes(self, body):
+        kind, payload = body[:1], body[1:]
+        if kind == b"F":
+            if self.frame is not None:
+                # Superseded before the worker got to it; the user has moved on
+                WS_FRAMES.inc(outcome="dropped")
+            self.frame = payload
+            self.pending.set()
+        elif kind == b"A":
+            if len(self.audio) + len(payload) > WS_MAX_AUDIO_BYTES:
+                raise ValueError("audio message too long")
+            self.audio += payload
+        else:
+            raise ValueError(f"unknown binary message type {kind!r}")
+
+    def handle_text(self, text):
+        message = json.loads(text)
+        if not isinstance(message, dict):
+            raise ValueError("text messages must be JSON objects")
+        kind = message.pop("type", None)
+        if kind == "config":
+            self.settings.update(app8.check_record_flag(message, peer_address(self.websocket),
+                                                        self.websocket.headers.get('x-recorder-token')))
+        elif kind == "ask":
+            self.question = {"text": message.get("text", "")}
+            if message.get("frame_id"):
+                # Follow-up about an already answered frame; no new frame needed
+                self.question["frame_id"] = message["frame_id"]
+                self.pending.set()
+        elif kind == "audio_end":
+            self.question = {"audio": bytes(self.audio)}
+            self.audio.clear()
+        else:
+            raise ValueError(f"unknown message type {kind!r}")
+
+    def take(self):
+        """The request for the newest frame, with any pending question attached."""
+        data = {**self.settings, "image": self.frame, **self.question}
+        if self.question:
+            data["continuous"] = False  # an explicit question always gets a full answer
+        self.frame, self.question = None, {}
+        self.pending.clear()
+        return data
+
+    async def push_alert(self, res, frame):
+        result = await run_in_cpu_pool(alerts.assess, res, frame.width, frame.height)
+        if result["alert"]:
+            await self.send({"type": "alert", **result})
+
+    async def serve(self, address, client):
+        """Answer frames one at a time, always the newest, until the socket closes."""
+        while True:
+            await self.pending.wait()
+            data = self.take()
+            WS_FRAMES.inc(outcome="answered")
+            timer = StageTimer(app8.STAGE_SECONDS)
+            try:
+                result = await answer_admitted(data, address, client, timer, on_detect=self.push_alert)
+                await self.send({"type": "reply", **result})
+            except app8.Rejected as e:
+                await self.send({"type": "error", "error": str(e), "status": e.status, "retry_after": e.retry_after})
+            except app8.QueryError as e:
+                await self.send({"type": "error", "error": str(e), "status": e.status})
+            except Exception as e:
+                logger.exception("Websocket query error")
+                await self.send({"type": "error", "error": str(e), "status": 500})
+
+
+async def video_socket(websocket):
+    await websocket.accept()
+    channel = FrameChannel(websocket)
+    open_channels.add(channel)
+    worker = asyncio.create_task(channel.serve(remote_address(websocket), admission_client(websocket)))
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            try:
+                if message.get("bytes") is not None:
+                    channel.handle_bytes(message["bytes"])
+                else:
+                    channel.handle_text(message["text"])
+            except ValueError as e:
+                await channel.send({"type": "error", "error": str(e), "status": 400})
+    finally:
+        worker.cancel()
+        open_channels.discard(channel)
+
+
+@metrics.register_collector
+def channel_metrics():
+    return [("shravan_ws_connections", "gauge", "Open websocket channels", {}, len(open_channels))]
+
+
+async def index(request):
+    return templates.TemplateResponse(request, 'index.html')
+
+
+async def health(request):
+    return JSONResponse({"status": "ok", "message": "Server is running", "mode": "asgi",
+                         "geo_cache": app8.geo_cache.stats(), "detector": app8.detector.stats(),
+                         "scene_cache": app8.scene_cache.stats(), "reply_cache": app8.reply_cache.stats(),
+                         "trackers": app8.trackers.stats(),
+                         "single_flight": app8.flights.stats(), "admission": app8.admission.stats(),
+                         "recorder": app8.recorder.stats(), "contexts": app8.contexts.stats(),
+                         "upstream": app8.upstream.stats()})
+
+
+async def ready(request):
+    body = {"status": "ready" if app8.ready.is_set() else "starting", "model": app8.YOLO_MODEL, **app8.startup}
+    return JSONResponse(body, status_code=200 if app8.ready.is_set() else 503)
+
+
+async def dump_recorder(request):
+    if not app8.recorder_allowed(peer_address(request), request.headers.get('x-recorder-token')):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    path, count = await run_in_cpu_pool(app8.dump_flights, data.get('session_id'))
+    return JSONResponse({"path": path, "records": count})
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global openai_client
+    openai_client = app8.upstream.async_openai()
+    logger.info("Starting Vision Assistant ASGI server")
+    yield
+    await openai_client.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/query', query, methods=['POST']),
+        Route('/query/stream', query_stream, methods=['POST']),
+        WebSocketRoute('/ws', video_socket),
+        Route('/health', health),
+        Route('/ready', ready),
+        Route('/metrics', metrics_endpoint),
+        Route('/recorder/dump', dump_recorder, methods=['POST']),
+        Mount('/static', StaticFiles(directory='static'), name='static'),
+    ],
+    lifespan=lifespan,
+)
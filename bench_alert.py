@@ -0,0 +1,52 @@
+"""Benchmark the /alert fast path in-process (YOLO + local rules, no network).
+
+    python bench_alert.py [frames_dir] [--runs 200]
+"""
+import argparse, base64, glob, io, os, statistics, time
+
+from PIL import Image
+
+import app8
+
+
+def load_frames(frames_dir):
+    paths = sorted(glob.glob(os.path.join(frames_dir, '*.jpg'))) if frames_dir else []
+    if paths:
+        return ['data:image/jpeg;base64,' + base64.b64encode(open(p, 'rb').read()).decode() for p in paths]
+    # No recordings given: a plain 640x480 frame still exercises decode + inference
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (128, 128, 128)).save(buf, 'JPEG')
+    return ['data:image/jpeg;base64,' + base64.b64encode(buf.getvalue()).decode()]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('frames_dir', nargs='?')
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=5)
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames_dir)
+    client = app8.app.test_client()
+    for i in range(args.warmup):
+        client.post('/alert', json={'image': frames[i % len(frames)]})
+
+    latencies = []
+    for i in range(args.runs):
+        start = time.perf_counter()
+        resp = client.post('/alert', json={'image': frames[i % len(frames)]})
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200, resp.get_json()
+
+    print(f"/alert over {args.runs} runs ({len(frames)} frames)")
+    print(f"  mean {statistics.mean(latencies):.1f} ms  p50 {percentile(latencies, 50):.1f} ms  "
+          f"p95 {percentile(latencies, 95):.1f} ms  p99 {percentile(latencies, 99):.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""Offline load test for app8: boots the app against local OpenAI/geolocation stubs
+and replays recorded frames (and optional audio clips) at a fixed concurrency.
+
+    python bench_app8.py recordings/frames --audio recordings/audio \\
+        --concurrency 8 --requests 200 --chat-latency 0.8
+
+Pass --server asgi to serve app8_asgi on uvicorn instead of the threaded Flask
+server, or --compare to run the same load against both back to back, each in
+its own process so caches and peak RSS aren't shared between runs. Pass --url
+to drive an already-running server instead (its upstreams are then whatever
+that server is configured with).
+"""
+import argparse, base64, glob, io, os, resource, statistics, subprocess, sys, threading, time
+
+import requests
+from PIL import Image
+
+from bench_stubs import StubUpstreams
+
+
+def load_files(directory, patterns):
+    paths = []
+    for pattern in patterns:
+        paths.extend(glob.glob(os.path.join(directory, pattern)))
+    return [open(p, 'rb').read() for p in sorted(paths)]
+
+
+def synthetic_frame():
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (128, 128, 128)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def load_app():
+    """Import app8 (after the stub env is set) and wait for the detector warmup."""
+    started = time.perf_counter()
+    import app8
+    if not app8.ready.wait(120):
+        raise RuntimeError("app8 never became ready (detector warmup)")
+    print(f"app ready in {time.perf_counter() - started:.2f}s ({', '.join(v.name for v in app8.detector.variants)}, "
+          f"first inference {app8.startup['first_inference_ms']} ms)")
+    return app8
+
+
+def serve_in_process(port, kind):
+    """Serve app8 on the threaded Flask/WSGI server or on uvicorn (ASGI); returns a stop callable."""
+    app8 = load_app()
+    if kind == 'flask':
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', port, app8.app, threaded=True)
+        threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+        return server.shutdown
+
+    import uvicorn
+    import app8_asgi
+    server = uvicorn.Server(uvicorn.Config(app8_asgi.app, host='127.0.0.1', port=port,
+                                           log_level='warning', backlog=4096))
+    thread = threading.Thread(target=server.run, name="bench-app", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def stop():
+        server.should_exit = True
+        thread.join()
+    return stop
+
+
+def build_request(args, frame, audio, i):
+    fields = {'text': '' if audio else 'What is in front of me?', 'session_id': f"bench-{i % args.sessions}"}
+    if args.no_cache:
+        fields['bypass_cache'] = 'true'
+    if args.binary:
+        files = {'image': ('frame.jpg', frame, 'image/jpeg')}
+        if audio:
+            files['audio'] = ('audio.webm', audio, 'audio/webm')
+        return {'data': fields, 'files': files}
+    fields['image'] = 'data:image/jpeg;base64,' + base64.b64encode(frame).decode()
+    if audio:
+        fields['audio'] = 'data:audio/webm;base64,' + base64.b64encode(audio).decode()
+    return {'json': fields}
+
+
+def run_load(args, base_url, frames, clips):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def worker():
+        session = requests.Session()
+        for i in counter:
+            audio = clips[i % len(clips)] if clips and i % args.audio_every == 0 else None
+            kwargs = build_request(args, frames[i % len(frames)], audio, i)
+            start = time.perf_counter()
+            try:
+                resp = session.post(base_url + args.endpoint, timeout=60, **kwargs)
+                resp.content  # drain streamed responses
+                ok = resp.status_code == 200
+            except requests.RequestException as e:
+                ok, resp = False, e
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(getattr(resp, 'status_code', str(resp)))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def report(args, latencies, errors, wall, in_process, label=None):
+    print(f"{args.endpoint}{f' [{label}]' if label else ''}: {args.requests} requests, concurrency {args.concurrency}")
+    print(f"  throughput {len(latencies) / wall:.2f} req/s over {wall:.1f} s, {len(errors)} errors")
+    if latencies:
+        ms = [l * 1000 for l in latencies]
+        print(f"  latency mean {statistics.mean(ms):.0f} ms  p50 {percentile(ms, 50):.0f} ms  "
+              f"p95 {percentile(ms, 95):.0f} ms  p99 {percentile(ms, 99):.0f} ms")
+    if in_process:
+        print(f"  peak RSS {peak_rss_mb():.0f} MB")
+    if errors:
+        print(f"  first errors: {errors[:5]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('frames_dir', nargs='?', help="directory of recorded *.jpg frames")
+    parser.add_argument('--audio', help="directory of recorded *.webm clips")
+    parser.add_argument('--audio-every', type=int, default=1, help="attach a clip to every Nth request")
+    parser.add_argument('--endpoint', default='/query', help="/query, /query/stream or /alert")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--sessions', type=int, default=4, help="distinct session ids to spread requests over")
+    parser.add_argument('--binary', action='store_true', help="upload multipart JPEG instead of JSON data URLs")
+    parser.add_argument('--no-cache', action='store_true', help="send bypass_cache on every request")
+    parser.add_argument('--chat-latency', type=float, default=0.8)
+    parser.add_argument('--whisper-latency', type=float, default=0.4)
+    parser.add_argument('--geo-latency', type=float, default=0.15)
+    parser.add_argument('--jitter', type=float, default=0.1, help="+/- fraction applied to each stub latency")
+    parser.add_argument('--port', type=int, default=8599, help="port for the in-process app")
+    parser.add_argument('--url', help="benchmark an already-running server instead")
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='flask',
+                        help="in-process server: threaded Flask (app8) or uvicorn (app8_asgi)")
+    parser.add_argument('--compare', action='store_true',
+                        help="run the same load against the Flask and the ASGI server back to back, one process each")
+    args = parser.parse_args()
+
+    frames = load_files(args.frames_dir, ['*.jpg', '*.jpeg']) if args.frames_dir else []
+    frames = frames or [synthetic_frame()]
+    clips = load_files(args.audio, ['*.webm', '*.ogg', '*.wav']) if args.audio else []
+
+    if args.url:
+        latencies, errors, wall = run_load(args, args.url, frames, clips)
+        report(args, latencies, errors, wall, in_process=False)
+        return
+
+    if args.compare:
+        # Each server in a fresh process, so neither run inherits the other's warm caches or peak RSS
+        argv = [a for a in sys.argv[1:] if a != '--compare']
+        for i, kind in enumerate(['flask', 'asgi']):
+            subprocess.run([sys.executable, os.path.abspath(__file__), *argv,
+                            '--server', kind, '--port', str(args.port + i)], check=True)
+        return
+
+    stubs = StubUpstreams(args.chat_latency, args.whisper_latency, args.geo_latency, args.jitter).start()
+    os.environ.update(stubs.env())
+    # Every bench request comes from one address, so the per-client limits would shed most of it; measure raw capacity
+    os.environ.setdefault("ADMISSION_PER_CLIENT", "0")
+    os.environ.setdefault("ADMISSION_RATE", "0")
+    try:
+        stop = serve_in_process(args.port, args.server)
+        try:
+            latencies, errors, wall = run_load(args, f"http://127.0.0.1:{args.port}", frames, clips)
+        finally:
+            stop()
+        report(args, latencies, errors, wall, in_process=True, label=args.server)
+        print(f"  upstream calls {dict(stubs.calls)}")
+    finally:
+        stubs.stop()
+
+
+if __name__ == '__main__':
+    main()
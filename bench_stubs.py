@@ -0,0 +1,176 @@
+"""Local stand-ins for the OpenAI and geolocation APIs, with injectable latency.
+
+Point the app at them through the environment before importing it::
+
+    stubs = StubUpstreams(chat_latency=0.8).start()
+    os.environ.update(stubs.env())
+    import app8
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_REPLY = "A person is standing ahead of you. The path to your left is clear."
+STUB_TRANSCRIPT = "What is in front of me?"
+STUB_COMPLETION_TOKENS = 20
+# Like OpenAI's prompt cache: prefixes of 1024+ tokens seen before are cached in 128-token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP = 128
+IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+STUB_LOCATION = {"city": "Stubville", "country": "ST", "lat": 18.52, "lon": 73.85, "status": "success"}
+
+
+class StubUpstreams:
+    """One threaded HTTP server answering chat completions, transcriptions and geolocation."""
+
+    def __init__(self, chat_latency=0.8, whisper_latency=0.4, geo_latency=0.15, jitter=0.1,
+                 host='127.0.0.1', port=0):
+        self.latency = {"chat": chat_latency, "whisper": whisper_latency, "geo": geo_latency}
+        self.jitter = jitter
+        self.calls = {"chat": 0, "whisper": 0, "geo": 0}
+        self._lock = threading.Lock()
+        self._prefixes = set()  # hashes of every message-part prefix sent so far
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment variables that route app8's upstream calls here."""
+        return {
+            "OPENAI_API_KEY": "stub-key",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "IPINFO_URL": f"{self.url}/ipinfo",
+            "IP_API_URL": f"{self.url}/ip-api",
+            "IPAPI_CO_URL": f"{self.url}/ipapi",
+        }
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="stub-upstreams", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def _delay(self, kind, share=1.0):
+        base = self.latency[kind] * share
+        time.sleep(max(0.0, base + random.uniform(-self.jitter, self.jitter) * base))
+
+    def usage(self, messages):
+        """Token usage for a chat request, with cached_tokens only for a prefix that really repeats."""
+        parts = []
+        for message in messages:
+            content = message.get("content")
+            for part in content if isinstance(content, list) else [{"type": "text", "text": content or ""}]:
+                if part.get("type") == "image_url":
+                    image = part["image_url"]
+                    parts.append((image["url"], IMAGE_TOKENS.get(image.get("detail", "auto"), 765)))
+                else:
+                    parts.append((part.get("text", ""), max(1, len(part.get("text", "")) // 4)))
+        total = cached = 0
+        chain = ""
+        with self._lock:
+            for content, tokens in parts:
+                chain = hashlib.blake2b((chain + content).encode(), digest_size=16).hexdigest()
+                total += tokens
+                if chain in self._prefixes:
+                    cached = total  # the chain hash covers every earlier part too
+                self._prefixes.add(chain)
+        cached = cached // CACHE_STEP * CACHE_STEP if cached >= CACHE_MIN_TOKENS else 0
+        return {"prompt_tokens": total, "completion_tokens": STUB_COMPLETION_TOKENS,
+                "total_tokens": total + STUB_COMPLETION_TOKENS, "prompt_tokens_details": {"cached_tokens": cached}}
+
+    def _handler(self):
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return self.rfile.read(length) if length else b""
+
+            def do_GET(self):
+                stubs._count("geo")
+                stubs._delay("geo")
+                self._send_json(STUB_LOCATION)
+
+            def do_POST(self):
+                body = self._read_body()
+                if self.path.endswith("/audio/transcriptions"):
+                    stubs._count("whisper")
+                    stubs._delay("whisper")
+                    self._send_json({"text": STUB_TRANSCRIPT})
+                elif self.path.endswith("/chat/completions"):
+                    stubs._count("chat")
+                    request = json.loads(body or b"{}")
+                    usage = stubs.usage(request.get("messages", []))
+                    if request.get("stream"):
+                        include_usage = (request.get("stream_options") or {}).get("include_usage")
+                        self._stream_chat(usage if include_usage else None)
+                    else:
+                        stubs._delay("chat")
+                        self._send_json(self._completion(STUB_REPLY, usage))
+                else:
+                    self._send_json({"error": {"message": f"no stub for {self.path}"}}, status=404)
+
+            def _completion(self, text, usage):
+                return {
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                    "model": "gpt-4o",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}],
+                    "usage": usage,
+                }
+
+            def _stream_chat(self, usage=None):
+                # A third of the latency before the first token, the rest spread over the words
+                words = STUB_REPLY.split(" ")
+                stubs._delay("chat", share=1 / 3)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, word in enumerate(words):
+                    chunk = {
+                        "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": "gpt-4o",
+                        "choices": [{"index": 0, "finish_reason": None,
+                                     "delta": {"content": word if i == 0 else " " + word}}],
+                    }
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                    time.sleep(stubs.latency["chat"] * (2 / 3) / len(words))
+                if usage is not None:
+                    chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": "gpt-4o", "choices": [], "usage": usage}
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,178 @@
+import logging
+import os
+import threading
+import time
+
+from yolo_batcher import BatchedDetector
+
+logger = logging.getLogger(__name__)
+
+
+class Variant:
+    """One detector option: a loaded model run at a given input size, with its measured CPU cost."""
+
+    def __init__(self, name, model, imgsz):
+        self.name = name
+        self.model = model
+        self.imgsz = imgsz
+        self.latency = None  # EWMA seconds per frame
+        self.frames = 0
+        self.failures = 0            # consecutive failed batches
+        self.suspended_until = 0.0   # monotonic time before which choose() skips it
+
+
+def parse_variants(spec):
+    """``[(model_path, imgsz)]`` from "yolov8s.pt@640,yolov8n.pt@640,yolov8n.pt@320" (most accurate first)."""
+    variants = []
+    for item in spec.split(','):
+        path, _, size = item.strip().rpartition('@')
+        if not path:
+            raise ValueError(f"detector variant {item!r} should look like model@imgsz")
+        variants.append((path, int(size)))
+    return variants
+
+
+def variant_name(path, imgsz):
+    return f"{os.path.basename(os.path.normpath(path))}@{imgsz}"
+
+
+class DetectorManager(BatchedDetector):
+    """Batched detector that picks a model / input size per batch to stay inside a latency budget.
+
+    ``variants`` are ordered most accurate first. Before each batch the
+    manager estimates how long the frames now queued would take on each
+    variant (its per-frame latency, measured online as an EWMA, times the
+    queue depth) and runs the most accurate one that fits ``budget``
+    seconds. Under load it steps down to cheaper variants; it only steps
+    back up once the better variant fits within ``step_up`` of the budget,
+    so it doesn't flap at the boundary.
+
+    A batch that fails on one variant is retried on the next. After
+    ``max_failures`` failed batches in a row a variant is suspended for
+    ``cooldown`` seconds, then tried again; only variants that fail
+    calibration are dropped for good.
+    """
+
+    def __init__(self, variants, budget=0.25, step_up=0.8, alpha=0.2, max_failures=3, cooldown=60.0,
+                 max_batch_size=8, max_wait=0.002, **predict_kwargs):
+        self.variants = variants
+        self.budget = budget
+        self.step_up = step_up
+        self.alpha = alpha
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.current = 0
+        self.switches = 0
+        self.disabled = []
+        # Calibration runs on the warmup thread; never run two variants at once
+        self._model_lock = threading.RLock()
+        super().__init__(variants[0].model, max_batch_size=max_batch_size, max_wait=max_wait, **predict_kwargs)
+
+    def choose(self, depth, tried=()):
+        """The most accurate variant whose expected time for ``depth`` frames fits the budget.
+
+        Skips ``tried`` and suspended variants, unless every untried one is suspended.
+        """
+        now = time.monotonic()
+        untried = [i for i, v in enumerate(self.variants) if v not in tried]
+        usable = [i for i in untried if now >= self.variants[i].suspended_until] or untried
+        chosen = usable[-1]
+        for i in usable:
+            variant = self.variants[i]
+            # Unmeasured variants get tried once so they have a latency to go by
+            if variant.latency is None:
+                chosen = i
+                break
+            limit = self.budget if i >= self.current else self.budget * self.step_up
+            if variant.latency * depth <= limit:
+                chosen = i
+                break
+        if chosen != self.current:
+            old, new = self.variants[self.current], self.variants[chosen]
+            logger.info(f"Detector {'down' if chosen > self.current else 'up'} to {new.name} "
+                        f"(from {old.name}, {depth} frames queued)")
+            self.current = chosen
+            self.switches += 1
+        return self.variants[chosen]
+
+    def _run_variant(self, variant, images):
+        with self._model_lock:
+            started = time.perf_counter()
+            results = variant.model(images, imgsz=variant.imgsz, **self.predict_kwargs)
+            per_frame = (time.perf_counter() - started) / len(images)
+        variant.latency = per_frame if variant.latency is None else \
+            variant.latency + self.alpha * (per_frame - variant.latency)
+        variant.frames += len(images)
+        variant.failures = 0
+        return results
+
+    def _failed(self, variant, error):
+        # Caller holds the model lock
+        variant.failures += 1
+        if variant.failures < self.max_failures:
+            logger.warning(f"Detector {variant.name} failed ({variant.failures}/{self.max_failures} in a row): {error}")
+            return
+        variant.suspended_until = time.monotonic() + self.cooldown
+        logger.error(f"Detector {variant.name} failed {variant.failures} batches in a row, "
+                     f"suspending it for {self.cooldown:g}s: {error}")
+
+    def _disable(self, variant, error):
+        # Calibration failures only; caller holds the model lock and the last variant is never dropped
+        if len(self.variants) == 1:
+            raise error
+        logger.error(f"Detector {variant.name} failed, disabling it: {error}")
+        name = self.variants[self.current].name
+        self.variants = [v for v in self.variants if v is not variant]
+        self.disabled.append(variant.name)
+        self.current = next((i for i, v in enumerate(self.variants) if v.name == name), 0)
+
+    def _infer(self, images):
+        with self._model_lock:
+            tried = []
+            while True:
+                # The frames in this batch plus the ones already waiting behind it
+                variant = self.choose(len(images) + self._queue.qsize(), tried)
+                try:
+                    return self._run_variant(variant, images)
+                except Exception as e:
+                    self._failed(variant, e)
+                    tried.append(variant)
+                    if len(tried) == len(self.variants):
+                        raise
+
+    def calibrate(self, image, runs=3):
+        """Run every variant ``runs`` times on ``image`` to seed its latency; returns the first-run seconds.
+
+        A variant that fails (e.g. a fixed-size export asked for another
+        imgsz) is disabled; only when every variant fails does this raise.
+        """
+        first = None
+        runs = max(1, runs)
+        with self._model_lock:
+            for variant in list(self.variants):
+                variant.latency = None
+                try:
+                    for i in range(runs):
+                        started = time.perf_counter()
+                        self._run_variant(variant, [image])
+                        if first is None:
+                            first = time.perf_counter() - started
+                        # The first run pays for lazy initialization; don't let it skew the estimate
+                        if i == 0 and runs > 1:
+                            variant.latency = None
+                except Exception as e:
+                    self._disable(variant, e)
+                    continue
+                logger.info(f"Detector {variant.name}: {variant.latency * 1000:.1f} ms/frame")
+        return first
+
+    def stats(self):
+        stats = super().stats()
+        stats["variant"] = self.variants[self.current].name
+        stats["switches"] = self.switches
+        stats["disabled"] = list(self.disabled)
+        stats["variants"] = [{"name": v.name, "imgsz": v.imgsz,
+                              "latency_ms": round(v.latency * 1000, 1) if v.latency is not None else None,
+                              "frames": v.frames, "failures": v.failures,
+                              "suspended": v.suspended_until > time.monotonic()} for v in self.variants]
+        return stats
@@ -0,0 +1,47 @@
+"""Export the YOLO checkpoint to a CPU-optimized format for faster startup and inference.
+
+    python export_model.py --format openvino --int8      # -> yolov8n_int8_openvino_model/
+    python export_model.py --format onnx                 # -> yolov8n.onnx
+
+Then start the server with YOLO_MODEL pointing at the printed path (and the
+same YOLO_IMGSZ the model was exported with), or list it in YOLO_VARIANTS as
+path@imgsz. Exports have a fixed input size, so export once per imgsz used.
+"""
+import argparse, os, shutil, time
+
+from ultralytics import YOLO
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default='yolov8n.pt')
+    parser.add_argument('--format', choices=['onnx', 'openvino'], default='openvino')
+    parser.add_argument('--imgsz', type=int, default=int(os.getenv("YOLO_IMGSZ", "640")))
+    parser.add_argument('--int8', action='store_true', help="INT8 post-training quantization (OpenVINO only)")
+    parser.add_argument('--dynamic', action='store_true', help="dynamic batch/input shapes (ONNX only)")
+    parser.add_argument('--data', default='coco128.yaml', help="calibration dataset for --int8")
+    args = parser.parse_args()
+
+    if args.int8 and args.format != 'openvino':
+        parser.error("--int8 is only supported with --format openvino")
+
+    kwargs = dict(format=args.format, imgsz=args.imgsz, half=False)
+    if args.int8:
+        kwargs.update(int8=True, data=args.data)
+    if args.dynamic:
+        kwargs.update(dynamic=True)
+
+    started = time.perf_counter()
+    path = YOLO(args.weights).export(**kwargs)
+    if args.int8:
+        # Keep the FP32 and INT8 exports side by side
+        int8_path = path.rstrip('/').replace('_openvino_model', '_int8_openvino_model')
+        if int8_path != path.rstrip('/'):
+            shutil.rmtree(int8_path, ignore_errors=True)
+            path = shutil.move(path, int8_path)
+    print(f"Exported {args.weights} -> {path} in {time.perf_counter() - started:.1f}s")
+    print(f"Run with: YOLO_MODEL={path} YOLO_IMGSZ={args.imgsz} python app8.py")
+
+
+if __name__ == '__main__':
+    main()
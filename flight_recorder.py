@@ -0,0 +1,90 @@
+import io
+import json
+import threading
+import time
+import zipfile
+from collections import OrderedDict, deque
+
+
+class FlightRecorder:
+    """Per-session ring buffers of recent queries, for reproducing slow requests offline.
+
+    Each record keeps the uploaded JPEG and audio as received plus a JSON
+    summary (question, detections, location, prompt, reply, stage timings).
+    Sessions keep their last ``per_session`` records; when the total passes
+    ``max_bytes`` the oldest records of the least recently active session go
+    first. ``dump`` writes everything to a zip archive that
+    ``replay_flights.py`` can replay.
+    """
+
+    def __init__(self, per_session=20, max_bytes=64 * 1024 * 1024, max_sessions=256):
+        self.per_session = per_session
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session -> deque of (meta, jpeg, audio, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.dropped = 0
+
+    def record(self, session, meta, jpeg=b"", audio=b""):
+        meta = dict(meta, session=session, recorded_at=time.time())
+        size = len(jpeg) + len(audio) + len(json.dumps(meta, default=str))
+        with self._lock:
+            ring = self._sessions.pop(session, None)
+            if ring is None:
+                ring = deque()
+            self._sessions[session] = ring  # most recently active last
+            ring.append((meta, jpeg, audio, size))
+            self._bytes += size
+            self.recorded += 1
+            if len(ring) > self.per_session:
+                self._bytes -= ring.popleft()[3]
+                self.dropped += 1
+            while len(self._sessions) > self.max_sessions:
+                _, old = self._sessions.popitem(last=False)
+                self._bytes -= sum(r[3] for r in old)
+                self.dropped += len(old)
+            while self._bytes > self.max_bytes and self._sessions:
+                oldest, old = next(iter(self._sessions.items()))
+                self._bytes -= old.popleft()[3]
+                self.dropped += 1
+                if not old:
+                    del self._sessions[oldest]
+
+    def dump(self, path, session=None):
+        """Write the buffered records (all sessions, or one) to a zip archive; returns how many."""
+        with self._lock:
+            sessions = [session] if session is not None else list(self._sessions)
+            records = [r for s in sessions for r in self._sessions.get(s, ())]
+        records.sort(key=lambda r: r[0]["recorded_at"])
+        manifest = io.StringIO()
+        with zipfile.ZipFile(path, 'w') as archive:
+            for i, (meta, jpeg, audio, _) in enumerate(records):
+                meta = dict(meta)
+                if jpeg:
+                    meta["frame"] = f"frames/{i:05d}.jpg"
+                    archive.writestr(meta["frame"], jpeg, compress_type=zipfile.ZIP_STORED)
+                if audio:
+                    meta["audio"] = f"audio/{i:05d}.bin"
+                    archive.writestr(meta["audio"], audio, compress_type=zipfile.ZIP_STORED)
+                manifest.write(json.dumps(meta, default=str) + "\n")
+            archive.writestr("manifest.jsonl", manifest.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+        return len(records)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "records": sum(len(r) for r in self._sessions.values()),
+                    "bytes": self._bytes, "recorded": self.recorded, "dropped": self.dropped}
+
+
+def load_archive(path):
+    """Records from a ``FlightRecorder.dump`` archive as dicts, with ``frame``/``audio`` replaced by bytes."""
+    records = []
+    with zipfile.ZipFile(path) as archive:
+        for line in archive.read("manifest.jsonl").decode('utf-8').splitlines():
+            meta = json.loads(line)
+            for blob in ("frame", "audio"):
+                meta[blob] = archive.read(meta[blob]) if meta.get(blob) else b""
+            records.append(meta)
+    return records
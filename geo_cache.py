@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class GeoCache:
+    """TTL + LRU cache in front of a slow geolocation lookup.
+
+    ``fetch(key)`` is called on a miss and should return the location string
+    or raise. Failures are cached for ``negative_ttl`` seconds so a dead
+    provider isn't hammered on every frame. Entries older than
+    ``refresh_after * ttl`` are refreshed in the background while the cached
+    value keeps being served, so steady-state callers never wait. Lookups
+    for different keys run ``workers`` at a time.
+    """
+
+    def __init__(self, fetch, ttl=900.0, negative_ttl=60.0, max_entries=1024,
+                 refresh_after=0.8, workers=2, executor=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.refresh_after = refresh_after
+        self.executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geo-lookup")
+        self._entries = OrderedDict()  # key -> (value, stored_at, ttl)
+        self._inflight = {}            # key -> Future for a lookup already running
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the location for ``key``, or None if the lookup failed."""
+        return self.get_future(key).result()
+
+    def get_future(self, key):
+        """Like ``get`` but returns a Future, already resolved on a cache hit.
+
+        Lets async callers wait on a miss without blocking their event loop.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at, ttl = entry
+                age = now - stored_at
+                if age < ttl:
+                    self._entries.move_to_end(key)
+                    if value is None:
+                        self.negative_hits += 1
+                    else:
+                        self.hits += 1
+                        if age >= ttl * self.refresh_after and key not in self._inflight:
+                            self.refreshes += 1
+                            self._start_lookup(key)
+                    done = Future()
+                    done.set_result(value)
+                    return done
+                del self._entries[key]
+            self.misses += 1
+            return self._inflight.get(key) or self._start_lookup(key)
+
+    def _start_lookup(self, key):
+        # Caller holds the lock
+        future = Future()
+        # Running futures can't be cancelled, so one caller giving up doesn't cancel it for the rest
+        future.set_running_or_notify_cancel()
+        self._inflight[key] = future
+        self.executor.submit(self._lookup, key, future)
+        return future
+
+    def _lookup(self, key, future):
+        try:
+            value = self.fetch(key)
+        except Exception as e:
+            logger.warning(f"Geolocation lookup failed for {key or 'server'}: {e}")
+            value = None
+        ttl = self.ttl if value is not None else self.negative_ttl
+        with self._lock:
+            # Don't let a failed background refresh clobber a good value
+            current = self._entries.get(key)
+            if value is not None or current is None or current[0] is None:
+                self._entries[key] = (value, time.monotonic(), ttl)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._inflight.pop(key, None)
+        future.set_result(value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+            }
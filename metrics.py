@@ -0,0 +1,125 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers a ~5 ms cache hit up to a stuck upstream call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_collectors = []
+
+
+def _label_str(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels, rendered in Prometheus text format."""
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[l]) for l in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with optional labels."""
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[l]) for l in self.labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                running = 0
+                for bound, count in zip(self.buckets, series):
+                    running += count
+                    lines.append(f"{self.name}_bucket{_label_str(self.labels, key, [('le', bound)])} {running}")
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_label_str(self.labels, key)} {series[-1]}")
+        return lines
+
+
+def register_collector(fn):
+    """Register ``fn() -> [(name, type, help, {labels}, value), ...]`` evaluated at scrape time.
+
+    Used for values that already live elsewhere (cache stats, queue depths).
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """Everything registered, in Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    # Samples of one metric family have to be contiguous, whichever collector produced them
+    families = {}
+    for collector in _collectors:
+        for name, kind, help, labels, value in collector():
+            family = families.setdefault(name, [f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+            family.append(f"{name}{_label_str(labels.keys(), labels.values())} {value}")
+    for family in families.values():
+        lines.extend(family)
+    return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Per-request stage timings, also fed into a shared stage histogram."""
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def record(self, stage, seconds):
+        self.stages[stage] = seconds
+        self.histogram.observe(seconds, stage=stage)
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def breakdown(self):
+        """Milliseconds per stage plus the request total so far."""
+        out = {stage: round(sec * 1000, 1) for stage, sec in self.stages.items()}
+        out["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return out
@@ -0,0 +1,126 @@
+import re
+
+# Fixed instructions, sent as the system message so every request shares the same prefix
+SYSTEM_PROMPT = """You are an AI assistant for a visually impaired person.
+
+Provide an extremely concise response (2-3 short sentences max) that:
+1. Mentions critical obstacles or dangers first if any exist
+2. Very briefly describes only the most important elements of the scene
+3. Answers the user's specific question directly
+4. Uses simple language and avoids unnecessary details
+
+Keep responses under 30 words whenever possible. Be direct and prioritize safety information."""
+
+# Token budget per user-message section
+SECTION_BUDGETS = {"speech": 80, "objects": 60, "location": 30, "changes": 50, "history": 120}
+
+# Word / punctuation pieces, a close stand-in for BPE tokens on English text
+PIECES = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+
+
+def _tiktoken():
+    """The gpt-4o tokenizer if tiktoken is installed, else None (counts are then approximate)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    enc = _tiktoken()
+    return len(enc.encode(text)) if enc else len(PIECES.findall(text))
+
+
+def truncate(text, budget):
+    """``(text, tokens)`` with ``text`` cut to at most ``budget`` tokens."""
+    enc = _tiktoken()
+    if enc:
+        tokens = enc.encode(text)
+        if len(tokens) <= budget:
+            return text, len(tokens)
+        return enc.decode(tokens[:budget]).rstrip() + "...", budget
+    pieces = list(PIECES.finditer(text))
+    if len(pieces) <= budget:
+        return text, len(pieces)
+    return text[:pieces[budget - 1].end()] + "...", budget
+
+
+def history_section(turns, budget):
+    """``(text, tokens)`` replaying earlier (question, reply) pairs, newest kept first when over ``budget``."""
+    if not turns:
+        return "", 0
+    header = "Earlier about this same view:"
+    used = count_tokens(header)
+    kept = []
+    for question, reply in reversed(turns):
+        line = f'User: "{question}" You: "{reply}"'
+        cost = count_tokens(line)
+        if used + cost > budget:
+            if not kept and budget > used:
+                line, cost = truncate(line, budget - used)
+                kept.append(line)
+                used += cost
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join([header] + kept[::-1]), used
+
+
+class Prompt:
+    """System + user text for one vision call, with per-section token counts and, after the call, usage."""
+
+    def __init__(self, system, user, tokens):
+        self.system = system
+        self.user = user
+        self.tokens = tokens
+        self.usage = None
+
+    @property
+    def total_tokens(self):
+        return sum(self.tokens.values())
+
+    def to_dict(self):
+        return {"system": self.system, "user": self.user, "tokens": self.tokens, "usage": self.usage}
+
+
+_system_tokens = None
+
+
+def build(speech, objects, location, changes="", history=(), budgets=SECTION_BUDGETS):
+    """Assemble the prompt; each variable section is held to its token budget.
+
+    ``history`` is the earlier (question, reply) pairs about the same frame, for follow-up questions.
+    """
+    global _system_tokens
+    if _system_tokens is None:
+        _system_tokens = count_tokens(SYSTEM_PROMPT)
+    tokens = {"system": _system_tokens}
+    sections = {}
+    for name, text in (("speech", speech), ("objects", objects), ("location", location), ("changes", changes)):
+        sections[name], tokens[name] = truncate(text or "", budgets[name])
+    sections["history"], tokens["history"] = history_section(history, budgets["history"])
+    lines = [sections["history"]] if sections["history"] else []
+    lines += [f'User said: "{sections["speech"]}"',
+              f'Detected objects in view: {sections["objects"]}',
+              sections["location"]]
+    if sections["changes"]:
+        lines.append(sections["changes"])
+    return Prompt(SYSTEM_PROMPT, "\n".join(lines), tokens)
+
+
+def read_usage(usage):
+    """Prompt / completion / cached token counts from an OpenAI ``usage`` object."""
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+    }
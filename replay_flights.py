@@ -0,0 +1,104 @@
+"""Replay a flight recorder archive through app8 offline, against local upstream stubs.
+
+    curl -X POST localhost:8501/recorder/dump -d '{"session_id": "abc"}' -H 'Content-Type: application/json'
+    python replay_flights.py recordings/flights_1718000000000.zip --slowest 5 --profile profiles/
+
+Record queries by starting the server with FLIGHT_RECORDER=1 (every session)
+or by sending "record": true with a request; like /recorder/dump, that is only
+honoured from loopback or with an X-Recorder-Token header matching
+RECORDER_TOKEN. Each record is replayed one at a time with the stubs answering
+after the same GPT / Whisper / geolocation latency it saw when recorded, so
+the replayed stage timings line up with the recorded ones and the local
+stages (decode, YOLO, prompt) can be profiled.
+The scene and reply caches are off during replay so every record runs its
+stages again; records that were answered from a cache when recorded are
+marked as such, since their replay calls GPT-4o where the original didn't.
+--profile writes a cProfile per replayed request; it covers the request
+thread, stage worker threads are not included.
+"""
+import argparse, cProfile, io, os, time
+
+from bench_stubs import StubUpstreams
+from flight_recorder import load_archive
+from vad import sniff_filename
+
+UPSTREAM_STAGES = {"chat": "gpt", "whisper": "whisper", "geo": "geo"}
+
+
+def replay_request(record):
+    """Multipart body reproducing a recorded query."""
+    data = {
+        'image': (io.BytesIO(record['frame']), 'frame.jpg'),
+        'text': record.get('text', ''),
+        'session_id': f"replay-{record['session']}",
+        'timings': 'true',
+    }
+    for name, on in record.get('flags', {}).items():
+        if on:
+            data[name] = 'true'
+    if record.get('audio'):
+        data['audio'] = (io.BytesIO(record['audio']), sniff_filename(record['audio']))
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archive', help="zip written by /recorder/dump")
+    parser.add_argument('--session', help="only replay this session")
+    parser.add_argument('--slowest', type=int, help="only replay the N slowest recorded requests")
+    parser.add_argument('--profile', metavar='DIR', help="write a cProfile .prof per replayed request here")
+    parser.add_argument('--fixed-latency', action='store_true',
+                        help="use the stubs' default latencies instead of each record's")
+    args = parser.parse_args()
+
+    records = [r for r in load_archive(args.archive) if r.get('frame')]
+    if args.session:
+        records = [r for r in records if r['session'] == args.session]
+    if args.slowest:
+        records = sorted(records, key=lambda r: r['timings'].get('total', 0), reverse=True)[:args.slowest]
+    if not records:
+        parser.error("no replayable records in the archive")
+
+    stubs = StubUpstreams(jitter=0.0).start()
+    os.environ.update(stubs.env())
+    # Replay must not be shed, re-recorded, or answered from what earlier records left in the caches
+    os.environ.update(ADMISSION_PER_CLIENT="0", ADMISSION_RATE="0", FLIGHT_RECORDER="0",
+                      SCENE_CACHE="0", REPLY_CACHE="0")
+    from bench_app8 import load_app
+    app8 = load_app()
+    client = app8.app.test_client()
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+
+    try:
+        for i, record in enumerate(records):
+            recorded = record['timings']
+            if not args.fixed_latency:
+                for kind, stage in UPSTREAM_STAGES.items():
+                    stubs.latency[kind] = recorded.get(stage, 0.0) / 1000
+
+            profiler = cProfile.Profile() if args.profile else None
+            started = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            resp = client.post('/query', data=replay_request(record), content_type='multipart/form-data')
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(args.profile, f"{i:05d}.prof"))
+            elapsed = (time.perf_counter() - started) * 1000
+
+            body = resp.get_json() or {}
+            replayed = body.get('timings', {})
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['recorded_at']))
+            note = ", cached when recorded" if record.get('cached') else ""
+            print(f"#{i} {record['session']} @ {when}: recorded {recorded.get('total', 0):.0f} ms, "
+                  f"replayed {elapsed:.0f} ms (HTTP {resp.status_code}{note})")
+            for stage in sorted(set(recorded) | set(replayed) - {'total'}):
+                if stage != 'total':
+                    print(f"    {stage:<20} {recorded.get(stage, '-'):>8} -> {replayed.get(stage, '-')}")
+    finally:
+        stubs.stop()
+
+
+if __name__ == '__main__':
+    main()
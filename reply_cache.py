@@ -0,0 +1,106 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from scene_cache import normalize_question
+
+# Filler that doesn't change what's being asked. Question words, directions
+# and negations stay: "what is on my left" and "is nothing on my right" differ.
+STOPWORDS = frozenset("""
+a an the is are am was were be been being i me my mine you your it its this that these those
+of in on at to for from with by about into please can could would will shall should do does did
+tell say let us just now there here some any see look like also hey ok okay so s
+""".split())
+
+COORDINATES = re.compile(r"Coordinates:\s*(-?\d+(?:\.\d+)?),\s*(-?\d+(?:\.\d+)?)")
+
+
+def question_key(text):
+    """Lowercased question with punctuation and stopwords stripped."""
+    return " ".join(w for w in normalize_question(text).split() if w not in STOPWORDS)
+
+
+def scene_key(summary):
+    """Spatial detection summary ("2 people center-near, car left-far") as an order-independent key."""
+    return tuple(sorted(part.strip() for part in summary.split(',') if part.strip()))
+
+
+def location_cell(location, cell=0.01):
+    """Quantized (lat, lon) grid cell from a geolocation line, or None when it has no coordinates."""
+    match = COORDINATES.search(location or "")
+    if match is None:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    return round(lat / cell), round(lon / cell)
+
+
+class ReplyCache:
+    """Share GPT-4o replies between queries that ask the same thing about the same kind of scene.
+
+    Keyed on the spatial detection summary (classes, counts, position and
+    distance), a coarse location cell and the normalized question, across
+    sessions. Locations without coordinates (a failed lookup, a bare city
+    name) could be anywhere, so those queries are never cached. LRU with a
+    ``ttl`` per entry, capped
+    at ``max_entries`` and roughly ``max_bytes`` of keys + replies.
+    """
+
+    def __init__(self, max_entries=2048, ttl=300.0, max_bytes=4 * 1024 * 1024, cell=0.01):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cell = cell
+        self._entries = OrderedDict()  # key -> (reply, stored_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, scene, location, question):
+        cell = location_cell(location, self.cell)
+        if cell is None:
+            return None
+        return scene_key(scene), cell, question_key(question)
+
+    def get(self, scene, location, question):
+        key = self.key(scene, location, question)
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+
+    def put(self, scene, location, question, reply):
+        key = self.key(scene, location, question)
+        if key is None:
+            return
+        size = sys.getsizeof(reply) + sum(sys.getsizeof(part) for part in key)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (reply, time.monotonic(), size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        # Caller holds the lock
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
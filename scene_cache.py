@@ -0,0 +1,82 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def dhash(img, size=8):
+    """64-bit difference hash of a PIL image (grayscale, downscaled to (size+1) x size)."""
+    small = np.asarray(img.convert('L').resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def normalize_question(text):
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+class SceneCache:
+    """Reuse the last reply when the camera is looking at the same scene.
+
+    A hit needs the same session, the same set of detected classes, the same
+    normalized question and a frame hash within ``threshold`` bits of a
+    recent frame. Bounded to ``max_entries`` (oldest first out), entries
+    expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries=256, ttl=30.0, threshold=6):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # (session, objects, question) -> [(hash, reply, stored_at)]
+        self._count = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(session, objects, question):
+        return session, frozenset(objects), normalize_question(question)
+
+    def get(self, session, frame_hash, objects, question):
+        key = self._key(session, objects, question)
+        now = time.monotonic()
+        with self._lock:
+            best = None
+            for h, reply, stored_at in self._entries.get(key, ()):
+                if now - stored_at < self.ttl and hamming(h, frame_hash) <= self.threshold:
+                    best = reply
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best
+
+    def put(self, session, frame_hash, objects, question, reply):
+        key = self._key(session, objects, question)
+        now = time.monotonic()
+        with self._lock:
+            old = self._entries.pop(key, [])
+            bucket = [e for e in old if now - e[2] < self.ttl]
+            bucket.append((frame_hash, reply, now))
+            self._entries[key] = bucket
+            self._count += len(bucket) - len(old)
+            # Evict the oldest frames until we're back under the cap
+            while self._count > self.max_entries:
+                old_key, old_bucket = next(iter(self._entries.items()))
+                old_bucket.pop(0)
+                self._count -= 1
+                if not old_bucket:
+                    del self._entries[old_key]
+
+    def stats(self):
+        with self._lock:
+            return {"size": self._count, "hits": self.hits, "misses": self.misses}
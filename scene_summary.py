@@ -0,0 +1,73 @@
+import numpy as np
+
+from alerts import NEAR_AREA
+
+POSITIONS = ('left', 'center', 'right')
+DISTANCES = ('near', 'far')
+
+# COCO names whose plural isn't just +s / +es
+IRREGULAR_PLURALS = {
+    'person': 'people', 'mouse': 'mice', 'knife': 'knives', 'sheep': 'sheep', 'skis': 'skis',
+    'scissors': 'scissors', 'skateboard': 'skateboards', 'wine glass': 'wine glasses',
+}
+
+_tables = {}  # id(names) -> (names, np.array of class names)
+
+
+def class_table(names):
+    """Class-id -> name lookup array for a YOLO ``names`` dict, built once per model."""
+    cached = _tables.get(id(names))
+    if cached is None or cached[0] is not names:
+        table = np.array([names[i] for i in range(max(names) + 1)] if names else [], dtype=object)
+        cached = _tables[id(names)] = (names, table)
+    return cached[1]
+
+
+def plural(name, count):
+    if count == 1:
+        return name
+    if name in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[name]
+    return name + ('es' if name.endswith(('s', 'sh', 'ch', 'x')) else 's')
+
+
+def postprocess(res, min_conf=0.3, near_area=NEAR_AREA, max_groups=8):
+    """One numpy pass over ``res.boxes``: confidence filter, class counts and spatial buckets.
+
+    Returns ``(labels, xyxy, conf, summary)`` for the boxes that pass
+    ``min_conf``, where ``summary`` reads like "3 people center-near, car
+    left-far" (nearest groups and biggest counts first, at most
+    ``max_groups`` groups).
+    """
+    boxes = res.boxes
+    cls = boxes.cls.cpu().numpy().astype(np.int64)
+    conf = boxes.conf.cpu().numpy()
+    xyxy = boxes.xyxy.cpu().numpy()
+
+    keep = conf >= min_conf
+    cls, conf, xyxy = cls[keep], conf[keep], xyxy[keep]
+    table = class_table(res.names)
+    labels = table[cls].tolist()
+    if not len(cls):
+        return labels, xyxy, conf, ''
+
+    height, width = res.orig_shape[:2]
+    cx = (xyxy[:, 0] + xyxy[:, 2]) / (2.0 * width)
+    area = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1]) / float(width * height)
+    position = np.digitize(cx, (1 / 3, 2 / 3))           # 0 left, 1 center, 2 right
+    distance = (area < near_area).astype(np.int64)      # 0 near, 1 far
+
+    # Count every (class, position, distance) bucket at once
+    buckets = len(POSITIONS) * len(DISTANCES)
+    counts = np.bincount(cls * buckets + position * len(DISTANCES) + distance, minlength=len(table) * buckets)
+    groups = np.flatnonzero(counts)
+    order = np.lexsort((-counts[groups], groups % len(DISTANCES)))  # near first, then biggest groups
+    parts = []
+    for group in groups[order][:max_groups]:
+        c, bucket = divmod(int(group), buckets)
+        pos, dist = divmod(bucket, len(DISTANCES))
+        n = int(counts[group])
+        name = plural(table[c], n)
+        parts.append(f"{n} {name} {POSITIONS[pos]}-{DISTANCES[dist]}" if n > 1 else
+                     f"{name} {POSITIONS[pos]}-{DISTANCES[dist]}")
+    return labels, xyxy, conf, ", ".join(parts)
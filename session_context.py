@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class FrameContext:
+    """A session's last answered frame: the frame, its detections and location, and what was said about it."""
+
+    def __init__(self, frame_id, frame, detections, location, size, max_turns):
+        self.frame_id = frame_id
+        self.frame = frame
+        self.detections = detections
+        self.location = location
+        self.history = deque(maxlen=max_turns)  # (question, reply), oldest first
+        self.frame_bytes = size
+        self.used = time.monotonic()
+
+    @property
+    def size(self):
+        return self.frame_bytes + sum(len(q) + len(r) for q, r in self.history)
+
+
+class SessionContexts:
+    """Per-session context for follow-up questions about the last frame, without re-uploading it.
+
+    Each session keeps only its newest frame plus the last ``max_turns``
+    question / reply pairs about that frame. Sessions are LRU-bounded by
+    ``max_sessions`` and roughly ``max_bytes`` in total, and dropped after
+    ``idle_ttl`` seconds without a query.
+    """
+
+    def __init__(self, max_sessions=1000, max_bytes=256 * 1024 * 1024, idle_ttl=300.0, max_turns=4):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()  # session -> FrameContext, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.follow_ups = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def recall(self, session, frame_id):
+        """The session's context if its last frame is ``frame_id`` and it hasn't gone idle, else None."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            context = self._sessions.get(session)
+            if context is None or context.frame_id != frame_id:
+                self.misses += 1
+                return None
+            context.used = now
+            self._sessions.move_to_end(session)
+            self.follow_ups += 1
+            return context
+
+    def history(self, session, frame_id):
+        """Earlier (question, reply) pairs about ``frame_id`` in this session."""
+        with self._lock:
+            context = self._sessions.get(session)
+            if context is None or context.frame_id != frame_id:
+                return []
+            return list(context.history)
+
+    def remember(self, session, frame_id, frame, detections, location, question, reply, size=0):
+        """Record a turn; a new ``frame_id`` replaces the session's context, the same one extends its history."""
+        now = time.monotonic()
+        with self._lock:
+            context = self._sessions.pop(session, None)
+            if context is not None:
+                self._bytes -= context.size
+                if context.frame_id != frame_id:
+                    context = None
+            if context is None:
+                context = FrameContext(frame_id, frame, detections, location, size, self.max_turns)
+            context.history.append((question, reply))
+            context.used = now
+            self._sessions[session] = context
+            self._bytes += context.size
+            self._expire(now)
+            while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                _, old = self._sessions.popitem(last=False)
+                self._bytes -= old.size
+                self.evictions += 1
+
+    def _expire(self, now):
+        # Caller holds the lock; oldest sessions sit at the front
+        while self._sessions:
+            oldest, context = next(iter(self._sessions.items()))
+            if now - context.used < self.idle_ttl:
+                break
+            del self._sessions[oldest]
+            self._bytes -= context.size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "bytes": self._bytes, "follow_ups": self.follow_ups,
+                    "misses": self.misses, "evictions": self.evictions}
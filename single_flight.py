@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+
+def request_key(*parts):
+    """Stable hash over request fields (str or bytes); None parts are skipped."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        if part is None:
+            continue
+        data = part if isinstance(part, bytes) else str(part).encode('utf-8')
+        # Length-prefix each field so ("ab", "c") and ("a", "bc") differ
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls: the first caller for a key does the work, the rest share its result.
+
+    Only calls that overlap are coalesced; once the leader finishes, the next
+    caller with the same key starts a fresh call.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> Future for the call in flight
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """``(future, leader)`` for ``key``; the leader must ``_finish`` it."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            # Running futures can't be cancelled, so a follower giving up doesn't cancel the leader's call
+            future.set_running_or_notify_cancel()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args):
+        """Run ``fn(*args)`` unless an identical call is in flight; returns ``(result, shared)``."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, False
+
+    async def do_async(self, key, fn, *args):
+        """``do`` for coroutine functions; followers await the leader without blocking the loop."""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.shield(asyncio.wrap_future(future)), True
+        try:
+            result = await fn(*args)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from scene_summary import plural
+
+
+def overlap_matrix(a, b):
+    """Pairwise overlap between two (N, 4) and (M, 4) xyxy box arrays.
+
+    The larger of IoU and intersection-over-smaller-box, so an object that
+    grows a lot between frames (walking towards the camera) still matches
+    its old box.
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = ((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]))[:, None]
+    area_b = ((b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]))[None, :]
+    iou = inter / np.maximum(area_a + area_b - inter, 1e-6)
+    contained = inter / np.maximum(np.minimum(area_a, area_b), 1e-6)
+    return np.maximum(iou, contained)
+
+
+class Track:
+    """One object followed across frames, with an alpha-beta (constant velocity) box filter."""
+
+    def __init__(self, track_id, name, box, now):
+        self.id = track_id
+        self.name = name
+        self.box = np.asarray(box, dtype=float)
+        self.velocity = np.zeros(4)
+        self.last_seen = now
+        self.misses = 0
+        self.narrated_area = self.area  # size when the user last heard about it
+
+    @property
+    def area(self):
+        return max(0.0, (self.box[2] - self.box[0]) * (self.box[3] - self.box[1]))
+
+    def predict(self, now):
+        return self.box + self.velocity * (now - self.last_seen)
+
+    def update(self, box, now, alpha=0.6, beta=0.3):
+        dt = max(now - self.last_seen, 1e-3)
+        predicted = self.predict(now)
+        residual = np.asarray(box, dtype=float) - predicted
+        self.box = predicted + alpha * residual
+        self.velocity = self.velocity + beta * residual / dt
+        self.last_seen = now
+        self.misses = 0
+
+
+class SceneDiff:
+    """What changed since the previous frame of a session."""
+
+    def __init__(self, new, gone, approaching, quiet_for, max_quiet):
+        self.new = new
+        self.gone = gone
+        self.approaching = approaching
+        self.quiet_for = quiet_for
+        self.max_quiet = max_quiet
+
+    @property
+    def significant(self):
+        return bool(self.new or self.gone or self.approaching) or self.quiet_for >= self.max_quiet
+
+    def summary(self):
+        """Cheap spoken line for frames that don't warrant a GPT call."""
+        return "No change."
+
+    def to_dict(self):
+        return {"new": self.new, "gone": self.gone, "approaching": self.approaching,
+                "significant": self.significant}
+
+
+def _counted(names):
+    return [f"{n} {plural(name, n)}" if n > 1 else name for name, n in sorted(Counter(names).items())]
+
+
+class SessionTracker:
+    """Greedy per-class overlap association of detections to tracks for one session."""
+
+    def __init__(self, min_overlap=0.3, max_misses=2, approach_growth=1.3, max_quiet=30.0):
+        self.min_overlap = min_overlap
+        self.max_misses = max_misses
+        self.approach_growth = approach_growth
+        self.max_quiet = max_quiet
+        self.tracks = []
+        self.next_id = 1
+        self.last_narrated = time.monotonic()
+
+    def update(self, names, boxes, now=None):
+        now = time.monotonic() if now is None else now
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        predicted = np.array([t.predict(now) for t in self.tracks]).reshape(-1, 4)
+        overlap = overlap_matrix(predicted, boxes)
+        # Only same-class pairs can match
+        for i, track in enumerate(self.tracks):
+            for j, name in enumerate(names):
+                if track.name != name:
+                    overlap[i, j] = 0.0
+
+        matched_tracks, matched_dets = set(), set()
+        while overlap.size and overlap.max() >= self.min_overlap:
+            i, j = np.unravel_index(np.argmax(overlap), overlap.shape)
+            self.tracks[i].update(boxes[j], now)
+            matched_tracks.add(i)
+            matched_dets.add(j)
+            overlap[i, :] = 0.0
+            overlap[:, j] = 0.0
+
+        new, gone, kept = [], [], []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    gone.append(track.name)
+                    continue
+            kept.append(track)
+        for j, name in enumerate(names):
+            if j not in matched_dets:
+                kept.append(Track(self.next_id, name, boxes[j], now))
+                self.next_id += 1
+                new.append(name)
+        self.tracks = kept
+
+        approaching = [t.name for t in self.tracks
+                       if t.misses == 0 and t.narrated_area > 0 and t.area / t.narrated_area >= self.approach_growth]
+        return SceneDiff(_counted(new), _counted(gone), _counted(approaching),
+                         now - self.last_narrated, self.max_quiet)
+
+    def mark_narrated(self, now=None):
+        """The user has just been told about the scene; future changes are measured from here."""
+        self.last_narrated = time.monotonic() if now is None else now
+        for track in self.tracks:
+            track.narrated_area = track.area
+
+
+class TrackerRegistry:
+    """Per-session trackers, LRU-bounded and evicted after ``idle_ttl`` seconds without frames."""
+
+    def __init__(self, max_sessions=1000, idle_ttl=300.0, **tracker_kwargs):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.tracker_kwargs = tracker_kwargs
+        self._sessions = OrderedDict()  # session -> (tracker, last_used)
+        self._lock = threading.Lock()
+
+    def _get(self, session, now):
+        entry = self._sessions.pop(session, None)
+        tracker = entry[0] if entry and now - entry[1] < self.idle_ttl else SessionTracker(**self.tracker_kwargs)
+        self._sessions[session] = (tracker, now)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        # Oldest sessions sit at the front; drop the idle ones
+        while self._sessions:
+            oldest, (_, used) = next(iter(self._sessions.items()))
+            if now - used < self.idle_ttl:
+                break
+            del self._sessions[oldest]
+        return tracker
+
+    def update(self, session, names, boxes):
+        now = time.monotonic()
+        with self._lock:
+            return self._get(session, now).update(names, boxes, now)
+
+    def mark_narrated(self, session):
+        with self._lock:
+            entry = self._sessions.get(session)
+            if entry:
+                entry[0].mark_narrated()
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions),
+                    "tracks": sum(len(t.tracks) for t, _ in self._sessions.values())}
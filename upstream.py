@@ -0,0 +1,117 @@
+import logging
+import random
+import threading
+import time
+
+import httpx
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamClients:
+    """Shared, pooled keep-alive clients for every outbound call the app makes.
+
+    ``http`` is a ``requests.Session`` for plain JSON APIs (geolocation) and
+    ``openai`` an ``openai.OpenAI`` client on a pooled httpx transport. Both
+    keep connections alive between requests so steady-state calls skip the
+    TCP + TLS handshake, and both count requests vs. newly opened connections.
+    """
+
+    def __init__(self, api_key=None, base_url=None, pool_size=32, connect_timeout=3.0,
+                 read_timeout=30.0, retries=2, backoff=0.2):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.counts = {"http_requests": 0, "http_retries": 0, "openai_requests": 0, "openai_connections": 0}
+
+        # Plain HTTP: our own jittered retry loop, so urllib3's is off
+        self.http = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.http.mount("http://", self._adapter)
+        self.http.mount("https://", self._adapter)
+
+        # OpenAI: the SDK already retries with jittered exponential backoff
+        http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                                keepalive_expiry=60.0),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            event_hooks={"request": [self._trace_openai_request]},
+        )
+        self.openai = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=retries,
+                                    http_client=http_client)
+
+    def async_openai(self):
+        """An ``AsyncOpenAI`` client with the same pool limits and counters, for the ASGI app.
+
+        Create it inside the event loop that will use it and ``close()`` it on shutdown.
+        """
+        async def trace_connect(event, info):
+            self._trace(event, info)
+
+        async def trace_request(request):
+            self._bump("openai_requests")
+            request.extensions["trace"] = trace_connect
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size,
+                                keepalive_expiry=60.0),
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            event_hooks={"request": [trace_request]},
+        )
+        return openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=self.retries,
+                                  http_client=http_client)
+
+    def _trace_openai_request(self, request):
+        self._bump("openai_requests")
+        # httpcore reports each fresh TCP connection through the trace extension
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            self._bump("openai_connections")
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self.counts[key] += amount
+
+    def get_json(self, url, timeout=3.0):
+        """GET ``url`` on the pooled session with jittered backoff on connection errors and 5xx/429."""
+        for attempt in range(self.retries + 1):
+            self._bump("http_requests")
+            try:
+                resp = self.http.get(url, timeout=(self.connect_timeout, timeout))
+                if resp.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return resp.json()
+                logger.warning(f"{url} returned {resp.status_code}, retrying")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"{url} failed ({e}), retrying")
+            self._bump("http_retries")
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def stats(self):
+        """Request and connection counts; ``reuse`` is the share of requests that skipped a new connection."""
+        http_connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                http_connections += pool.num_connections
+        with self._lock:
+            counts = dict(self.counts)
+        counts["http_connections"] = http_connections
+        for client in ("http", "openai"):
+            reqs, conns = counts[f"{client}_requests"], counts[f"{client}_connections"]
+            counts[f"{client}_reuse"] = round(1 - conns / reqs, 3) if reqs else 0.0
+        return counts
@@ -0,0 +1,148 @@
+import io
+import logging
+import wave
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PCM_RATE = 16000  # what compressed clips are decoded to; plenty for speech
+
+
+class Clip:
+    """Audio ready for Whisper: the bytes to upload, a filename that names the format, and whether anyone spoke."""
+
+    def __init__(self, data, filename, speech=True, duration=None, kept=None):
+        self.data = data
+        self.filename = filename
+        self.speech = speech
+        self.duration = duration  # seconds in the original clip, when it could be decoded
+        self.kept = kept          # seconds left after trimming
+
+
+def sniff_filename(audio_bytes):
+    """Upload filename for a clip; Whisper picks the decoder from the extension."""
+    if audio_bytes[:4] == b'RIFF' and audio_bytes[8:12] == b'WAVE':
+        return "audio.wav"
+    if audio_bytes[:4] == b'OggS':
+        return "audio.ogg"
+    return "audio.webm"
+
+
+def read_wav(audio_bytes):
+    """Mono int16 samples and rate from a 16-bit PCM WAV, or None for other sample formats."""
+    with wave.open(io.BytesIO(audio_bytes)) as wav:
+        if wav.getsampwidth() != 2:
+            return None
+        channels, rate = wav.getnchannels(), wav.getframerate()
+        pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+    if channels > 1:
+        pcm = pcm[:len(pcm) - len(pcm) % channels].reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return pcm, rate
+
+
+def decode_pcm(audio_bytes):
+    """``(samples, rate)`` for a clip, or None if it can't be decoded in-process.
+
+    WAV is read with the standard library; webm/ogg need PyAV (``pip install av``).
+    """
+    if sniff_filename(audio_bytes) == "audio.wav":
+        return read_wav(audio_bytes)
+    try:
+        import av
+    except ImportError:
+        return None
+    chunks = []
+    with av.open(io.BytesIO(audio_bytes)) as container:
+        resampler = av.AudioResampler(format='s16', layout='mono', rate=PCM_RATE)
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                chunks.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+    return (np.concatenate(chunks) if chunks else np.zeros(0, np.int16)), PCM_RATE
+
+
+def speech_bounds(pcm, rate, frame_ms=30, margin_db=12.0, floor_db=-50.0, ceiling_db=-35.0,
+                  min_speech_ms=150, pad_ms=250):
+    """Sample range ``(start, end)`` holding the speech in ``pcm``, or None if it's all silence.
+
+    Frames are voiced when their RMS level clears the clip's noise floor (10th
+    percentile) by ``margin_db``; the threshold is clamped to
+    ``[floor_db, ceiling_db]`` dBFS so a silent clip isn't all "speech" and a
+    clip that is all speech isn't all "silence".
+    """
+    hop = max(1, rate * frame_ms // 1000)
+    n = len(pcm) // hop
+    if n == 0:
+        return None
+    frames = pcm[:n * hop].astype(np.float32).reshape(n, hop) / 32768.0
+    level = 20 * np.log10(np.sqrt(np.mean(frames ** 2, axis=1)) + 1e-9)
+    threshold = np.clip(np.percentile(level, 10) + margin_db, floor_db, ceiling_db)
+    voiced = np.flatnonzero(level > threshold)
+    if len(voiced) * frame_ms < min_speech_ms:
+        return None
+    pad = rate * pad_ms // 1000
+    return max(0, voiced[0] * hop - pad), min(len(pcm), (voiced[-1] + 1) * hop + pad)
+
+
+def encode_wav(pcm, rate):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.astype('<i2').tobytes())
+    return buf.getvalue()
+
+
+def encode_opus(pcm, rate, bit_rate=24000):
+    """Ogg/Opus bytes for mono int16 samples (needs PyAV)."""
+    import av
+    buf = io.BytesIO()
+    with av.open(buf, 'w', format='ogg') as out:
+        stream = out.add_stream('libopus', rate=rate)
+        stream.layout = 'mono'
+        stream.bit_rate = bit_rate
+        frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format='s16', layout='mono')
+        frame.rate = rate
+        for packet in stream.encode(frame):
+            out.mux(packet)
+        for packet in stream.encode(None):
+            out.mux(packet)
+    return buf.getvalue()
+
+
+def prepare_clip(audio_bytes, min_trim=0.1, **vad_kwargs):
+    """Run voice activity detection on a push-to-talk clip and trim leading/trailing silence.
+
+    Clips that can't be decoded here are passed through untouched. Trimming
+    under ``min_trim`` of the clip isn't worth a re-encode, so those go up as
+    recorded too.
+    """
+    filename = sniff_filename(audio_bytes)
+    try:
+        decoded = decode_pcm(audio_bytes)
+    except Exception as e:
+        logger.warning(f"Couldn't decode audio for VAD, sending as-is: {e}")
+        decoded = None
+    if decoded is None:
+        return Clip(audio_bytes, filename)
+
+    pcm, rate = decoded
+    duration = len(pcm) / rate
+    bounds = speech_bounds(pcm, rate, **vad_kwargs)
+    if bounds is None:
+        return Clip(b"", filename, speech=False, duration=duration, kept=0.0)
+    start, end = bounds
+    kept = (end - start) / rate
+    if kept >= duration * (1 - min_trim):
+        return Clip(audio_bytes, filename, duration=duration, kept=duration)
+
+    trimmed = pcm[start:end]
+    if filename != "audio.wav":
+        try:
+            return Clip(encode_opus(trimmed, rate), "audio.ogg", duration=duration, kept=kept)
+        except Exception as e:
+            logger.warning(f"Opus encode failed, sending trimmed WAV: {e}")
+    return Clip(encode_wav(trimmed, rate), "audio.wav", duration=duration, kept=kept)
@@ -0,0 +1,113 @@
+import base64
+import io
+import math
+import re
+
+# GPT-4o image pricing: low detail is a flat 85 tokens on a 512px image; high detail
+# fits the image in 2048x2048, shrinks the short side to 768 and charges per 512px tile
+LOW_DETAIL_TOKENS = 85
+LOW_DETAIL_SIDE = 512
+TILE_TOKENS = 170
+
+# Questions about the scene as a whole; a low-detail frame answers these fine
+GENERAL_PATTERNS = re.compile(
+    r"where am i|describe|what do you see|what can you see|around me|surround|"
+    r"what('s| is) (here|this place)|tell me where")
+
+# Words people use for detected COCO classes
+SYNONYMS = {
+    'person': ('people', 'man', 'woman', 'men', 'women', 'someone', 'somebody', 'guy', 'child', 'kid'),
+    'car': ('vehicle', 'vehicles'),
+    'cell phone': ('phone', 'mobile'),
+    'tv': ('television', 'screen'),
+    'dining table': ('table',),
+    'couch': ('sofa',),
+    'motorcycle': ('bike', 'motorbike'),
+    'bicycle': ('bike', 'cycle'),
+}
+
+
+def high_detail_tokens(width, height):
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return LOW_DETAIL_TOKENS + TILE_TOKENS * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def mentioned_classes(question, names):
+    """Detected class names the question refers to, directly or through a synonym."""
+    words = set(re.findall(r"[a-z]+", question.lower()))
+    text = " ".join(re.findall(r"[a-z]+", question.lower()))
+    hits = set()
+    for name in set(names):
+        if f" {name} " in f" {text} " or f"{name}s" in words or words & set(SYNONYMS.get(name, ())):
+            hits.add(name)
+    return hits
+
+
+def union_box(boxes, pad, width, height):
+    x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+    x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+    px, py = (x2 - x1) * pad, (y2 - y1) * pad
+    return (max(0, int(x1 - px)), max(0, int(y1 - py)),
+            min(width, int(math.ceil(x2 + px))), min(height, int(math.ceil(y2 + py))))
+
+
+def encode(image, quality):
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG', quality=quality)
+    return f"data:image/jpeg;base64,{base64.b64encode(buf.getvalue()).decode('utf-8')}"
+
+
+class VisionPayload:
+    """What actually gets sent to the vision model for one request."""
+
+    def __init__(self, url, detail, size, tokens, mode):
+        self.url = url
+        self.detail = detail
+        self.size = size
+        self.tokens = tokens
+        self.mode = mode  # "low", "roi" or "full"
+
+
+def plan_payload(frame, question, names, boxes, token_budget=765, quality=85, low_quality=70,
+                 roi_pad=0.15, min_roi_share=0.05):
+    """Pick crop, resolution, detail and JPEG quality for the GPT-4o image.
+
+    ``names``/``boxes`` are the detections in the frame's detector coordinates.
+    General "where am I" questions get a single low-detail image; questions
+    about a detected object get that object's region, everything else gets
+    the whole frame shrunk until it fits ``token_budget``.
+    """
+    image = frame.vision_image
+
+    if GENERAL_PATTERNS.search(question.lower()) or token_budget < LOW_DETAIL_TOKENS + TILE_TOKENS:
+        low = image.copy()
+        low.thumbnail((LOW_DETAIL_SIDE, LOW_DETAIL_SIDE))
+        return VisionPayload(encode(low, low_quality), "low", low.size, LOW_DETAIL_TOKENS, "low")
+
+    mode = "full"
+    targets = mentioned_classes(question, names)
+    if targets and len(boxes):
+        keep = [i for i, n in enumerate(names) if n in targets]
+        sx, sy = image.width / frame.width, image.height / frame.height
+        roi = boxes[keep] * [sx, sy, sx, sy]
+        crop = union_box(roi, roi_pad, image.width, image.height)
+        # A tiny crop loses all context; only bother when it is a real region
+        if (crop[2] - crop[0]) * (crop[3] - crop[1]) >= min_roi_share * image.width * image.height:
+            image = image.crop(crop)
+            mode = "roi"
+
+    w, h = image.size
+    while high_detail_tokens(w, h) > token_budget and min(w, h) > 64:
+        w, h = int(w * 0.8), int(h * 0.8)
+    if (w, h) != image.size:
+        image = image.resize((w, h))
+
+    if mode == "full" and image is frame.vision_image:
+        # Nothing changed: reuse the frame's own payload (often the client's JPEG untouched)
+        url = frame.data_url
+    else:
+        url = encode(image, quality)
+    return VisionPayload(url, "high", (w, h), high_detail_tokens(w, h), mode)
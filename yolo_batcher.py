@@ -0,0 +1,91 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedDetector:
+    """Micro-batching front end for a loaded YOLO model.
+
+    Callers on any thread call ``predict(image)`` and get back their own
+    ``Results`` object. A single worker thread drains the queue and runs one
+    batched forward pass for up to ``max_batch_size`` frames. A lone request
+    is run straight away; the worker only lingers up to ``max_wait`` seconds
+    for more frames when other requests are already queued behind it, so
+    idle-server latency is unchanged while concurrent load gets batched.
+    """
+
+    def __init__(self, model, max_batch_size=8, max_wait=0.002, **predict_kwargs):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.predict_kwargs = predict_kwargs
+        self._queue = queue.Queue()
+        self.batches = 0
+        self.frames = 0
+        self._worker = threading.Thread(target=self._run, name="yolo-batcher", daemon=True)
+        self._worker.start()
+
+    def predict(self, image, timeout=None):
+        """Queue ``image`` for the next batch and wait for its result."""
+        return self.submit(image).result(timeout=timeout)
+
+    def submit(self, image):
+        """Queue ``image`` for the next batch; returns a Future for its result."""
+        future = Future()
+        self._queue.put((image, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Grab whatever piled up while the previous batch was running
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Under concurrency, give stragglers a short window to join
+        if 1 < len(batch) < self.max_batch_size and self.max_wait > 0:
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _infer(self, images):
+        return self.model(images, **self.predict_kwargs)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip callers that already gave up waiting
+            batch = [(img, fut) for img, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self._infer([img for img, _ in batch])
+            except Exception as e:
+                logger.error(f"Batched YOLO inference failed: {e}")
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.frames += len(batch)
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch_size": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }